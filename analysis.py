@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+评论分析引擎
+逐条评论只扫描、分词各一次，结果存为紧凑的列式表：
+  - flags：uint16 位掩码，低 9 位为各维度（顺序同 ASPECTS），高位为投诉/表扬/设施/噪音标记
+  - sentiment：float32 情感得分
+聚合与按维度筛选均为 NumPy 向量化的位运算。
+大批量评论可拆分到进程池并行分词，小批量自动退回串行以免承担进程启动开销。
+"""
+
+import os
+import re
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import jieba
+import metrics
+from lexicon import LEXICON, ASPECTS, POSITIVE_WORDS, NEGATIVE_WORDS
+
+# ==================== 位掩码定义 ====================
+ASPECT_BITS = {aspect: 1 << i for i, aspect in enumerate(ASPECTS)}
+FLAG_COMPLAINT = 1 << 9
+FLAG_PRAISE = 1 << 10
+FLAG_FACILITY_ISSUE = 1 << 11
+FLAG_NOISE = 1 << 12
+
+# Excel 中可能自带的维度评分列
+RATING_COLUMNS = ['设施', '卫生', '环境', '服务']
+
+# ==================== 并行配置 ====================
+DEFAULT_WORKERS = int(os.getenv("ANALYSIS_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_ROWS = 20000  # 少于该行数时串行处理
+
+# ==================== 优化建议库 ====================
+SUGGESTIONS = {
+    '位置': '优化导航信息，与周边商圈合作提供折扣弥补位置短板。',
+    '交通': '提供免费接驳车或与打车平台合作，提升客人便利性。',
+    '早餐': '丰富早餐品类，增加本地特色和健康选项，提升餐品温度。',
+    '安静': '优化隔音设计，更换密封性更好的门窗，减少噪音干扰。',
+    '床舒适': '升级床垫与床品材质，提供软硬两种枕头供客人选择。',
+    '房间大小': '优化小房型空间布局，推出“大房型优先升级”优惠活动。',
+    '视野': '定期清洁窗户与阳台，避免景观遮挡，拍摄高质量宣传图。',
+    '性价比': '调整价格策略，推出不同时段优惠套餐，增加增值服务。',
+    '网络': '升级Wi-Fi带宽，确保全区域稳定覆盖，设置一键连接页面。',
+    '设施': '定期检修设备运行状态，补充人性化设施如USB充电口、小冰箱，增设无障碍通道。',
+    '卫生': '加强清洁流程监督，使用可视化清洁标准，重点消毒高频接触区域。',
+    '环境': '优化公共区域绿植布置，统一装修风格提升质感，营造主题化空间氛围。',
+    '服务': '加强员工服务礼仪培训，建立快速响应机制，推行个性化主动服务。'
+}
+
+# ==================== 情感分析 ====================
+def preprocess(text):
+    """文本预处理：去除非中文/英文字符，分词"""
+    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z]', '', str(text).lower())
+    words = jieba.lcut(text)
+    return [w for w in words if len(w) >= 2]
+
+def get_sentiment_score(text):
+    """基于关键词的情感分析"""
+    words = preprocess(text)
+    pos_count = sum(1 for w in words if w in POSITIVE_WORDS)
+    neg_count = sum(1 for w in words if w in NEGATIVE_WORDS)
+    total = pos_count + neg_count
+    if total == 0:
+        return 3.8
+    if pos_count > neg_count:
+        return min(5.0, 4.5 + 0.5 * (pos_count / total))
+    elif neg_count > pos_count:
+        return max(1.0, 2.5 - 0.5 * (neg_count / total))
+    else:
+        return 3.8
+
+# ==================== 单条评论 ====================
+def comment_flags(text):
+    """扫描一遍评论，返回维度与标记的位掩码"""
+    hits = LEXICON.scan(text)
+    flags = hits.aspect_mask
+    if hits.neg_count > hits.pos_count:
+        flags |= FLAG_COMPLAINT
+    elif hits.pos_count > hits.neg_count:
+        flags |= FLAG_PRAISE
+    if hits.has_facility_issue:
+        flags |= FLAG_FACILITY_ISSUE
+    if hits.has_noise:
+        flags |= FLAG_NOISE
+    return flags
+
+def decode_flags(flags):
+    """将位掩码还原为 extract_aspects_and_sentiment 的字典格式"""
+    flags = int(flags)
+    if flags & FLAG_COMPLAINT:
+        sentiment = "负面"
+    elif flags & FLAG_PRAISE:
+        sentiment = "正面"
+    else:
+        sentiment = "中性"
+    return {
+        'aspects': [a for a, bit in ASPECT_BITS.items() if flags & bit],
+        'sentiment': sentiment,
+        'has_complaint': bool(flags & FLAG_COMPLAINT),
+        'has_praise': bool(flags & FLAG_PRAISE),
+        'has_facility_issue': bool(flags & FLAG_FACILITY_ISSUE),
+        'has_noise': bool(flags & FLAG_NOISE)
+    }
+
+def extract_aspects_and_sentiment(text):
+    """
+    从评论中提取涉及的维度（aspects）和整体情感倾向
+    返回：dict(aspects=list, sentiment=str, has_complaint=bool, has_praise=bool, has_facility_issue=bool, has_noise=bool)
+    """
+    return decode_flags(comment_flags(text))
+
+# ==================== 列式批量分析 ====================
+def _analyze_values(texts):
+    """
+    分析一段评论文本（None 表示空评论），返回 (flags, sentiment, 关键词扫描耗时, 分词与情感耗时)
+    耗时在子进程内分别累计后随结果返回，由主进程记入埋点
+    """
+    flags = []
+    sentiment = []
+    scan_seconds = 0.0
+    sentiment_seconds = 0.0
+    clock = time.perf_counter
+    for text in texts:
+        if text is None:
+            flags.append(0)
+            sentiment.append(np.nan)
+            continue
+        t0 = clock()
+        flags.append(comment_flags(text))
+        t1 = clock()
+        sentiment.append(get_sentiment_score(text))
+        scan_seconds += t1 - t0
+        sentiment_seconds += clock() - t1
+    return (np.array(flags, dtype=np.uint16), np.array(sentiment, dtype=np.float32),
+            scan_seconds, sentiment_seconds)
+
+def _init_worker():
+    """子进程初始化：每个进程只加载一次 jieba 词典"""
+    jieba.setLogLevel(logging.WARNING)
+    jieba.initialize()
+
+def warm_up():
+    """预热：加载 jieba 词典并分析一条示例评论，返回耗时（秒）；之后的首个真实请求不再等待词典构建"""
+    start = time.perf_counter()
+    _init_worker()
+    extract_aspects_and_sentiment("房间干净，服务热情，就是有点吵")
+    return time.perf_counter() - start
+
+def make_pool(workers):
+    """创建分析进程池，可在多次 analyze_comments 调用间复用（如分块读取大文件时）"""
+    # spawn 启动方式避免在多线程的 Streamlit 服务进程中 fork
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_comment(text):
+    """
+    去重用的规范化：转小写、去掉首尾空白、连续空白合并为一个空格
+    词库匹配不区分大小写且关键词不含空白，情感分析会先去掉非字母字符，因此规范化不改变分析结果
+    """
+    return _WHITESPACE_RE.sub(' ', str(text).lower()).strip()
+
+def dedupe_comments(comments):
+    """
+    规范化并去重：返回 (codes, uniques)
+    codes 为每条评论在 uniques 中的位置（空评论为 -1），uniques 为不重复的规范化文本列表
+    """
+    codes, uniques = pd.factorize(pd.Series(
+        [None if pd.isna(c) else normalize_comment(c) for c in comments], dtype=object
+    ))
+    return codes, list(uniques)
+
+def analyze_comments(comments, workers=None, pool=None):
+    """
+    批量分析评论列，返回与输入索引对齐的列式结果表
+    列：flags(uint16)、sentiment(float32)；空评论的 flags 为 0、sentiment 为 NaN
+    重复评论（规范化后文本相同）只分析一次，结果按出现次数展开回每一行，维度均值不受影响
+    workers：并行进程数，默认读取环境变量 ANALYSIS_WORKERS（缺省为 CPU 核数）；
+             为 1 或不重复的评论数少于 PARALLEL_MIN_ROWS 时串行处理
+    pool：可选，复用 make_pool 创建的进程池；不传则本次调用临时创建
+    """
+    if workers is None:
+        workers = DEFAULT_WORKERS
+    start = time.perf_counter()
+    codes, texts = dedupe_comments(comments)
+
+    if workers <= 1 or len(texts) < PARALLEL_MIN_ROWS:
+        results = [_analyze_values(texts)]
+    else:
+        # 每个进程分到多个块以平衡负载；map 按提交顺序返回，结果可直接拼接
+        chunk_size = -(-len(texts) // (workers * 4))
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        if pool is None:
+            with make_pool(workers) as own_pool:
+                results = list(own_pool.map(_analyze_values, chunks))
+        else:
+            results = list(pool.map(_analyze_values, chunks))
+    unique_flags = np.concatenate([r[0] for r in results])
+    unique_sentiment = np.concatenate([r[1] for r in results])
+
+    # 按 codes 展开；末尾追加空评论的结果，使 -1 恰好取到它
+    flags = np.append(unique_flags, np.uint16(0))[codes]
+    sentiment = np.append(unique_sentiment, np.float32(np.nan))[codes]
+
+    metrics.observe("keyword_scan", sum(r[2] for r in results))
+    metrics.observe("jieba_sentiment", sum(r[3] for r in results))
+    metrics.observe("analyze_comments", time.perf_counter() - start)
+    metrics.incr("analyze_rows", len(codes))
+    metrics.incr("analyze_unique_texts", len(texts))
+    return pd.DataFrame({'flags': flags, 'sentiment': sentiment}, index=comments.index)
+
+def aspect_matrix(table):
+    """展开为 (评论数 × 维度数) 的布尔矩阵"""
+    flags = table['flags'].to_numpy()
+    return (flags[:, None] & np.array(list(ASPECT_BITS.values()), dtype=np.uint16)) != 0
+
+def filter_by_aspect(table, *aspects, match_all=False):
+    """按维度筛选评论：默认命中任一维度即可，match_all=True 时须同时命中全部维度"""
+    mask = 0
+    for aspect in aspects:
+        mask |= ASPECT_BITS[aspect]
+    hit = table['flags'].to_numpy() & np.uint16(mask)
+    keep = hit == mask if match_all else hit != 0
+    return table[keep]
+
+def annotate_comments(table):
+    """
+    将结果表展开为可读列（与输入索引对齐）：提及维度、情感倾向、情感评分、设施问题、噪音问题
+    不同的 flags 取值很少，每种取值只解码一次
+    """
+    flags = table['flags']
+    decoded = {int(f): decode_flags(f) for f in flags.unique()}
+    codes = flags.astype(int)
+    return pd.DataFrame({
+        '提及维度': codes.map({f: "、".join(d['aspects']) for f, d in decoded.items()}),
+        '情感倾向': codes.map({f: d['sentiment'] for f, d in decoded.items()}),
+        '情感评分': table['sentiment'].astype(float).round(2),
+        '设施问题': codes.map({f: d['has_facility_issue'] for f, d in decoded.items()}),
+        '噪音问题': codes.map({f: d['has_noise'] for f, d in decoded.items()})
+    }, index=table.index)
+
+def dimension_totals(table):
+    """各维度情感得分的累计和与命中数（index 为维度），分块结果可直接相加"""
+    hits = aspect_matrix(table)
+    sentiment = np.nan_to_num(table['sentiment'].to_numpy(dtype=np.float64))
+    return pd.DataFrame({'sum': sentiment @ hits, 'count': hits.sum(axis=0)}, index=ASPECTS)
+
+def rating_totals(df, columns=RATING_COLUMNS):
+    """Excel 中已有维度评分列的累计和与有效行数，格式同 dimension_totals"""
+    present = [col for col in columns if col in df.columns]
+    values = df[present].apply(pd.to_numeric, errors='coerce')
+    return pd.DataFrame({'sum': values.sum(), 'count': values.count()}, index=present)
+
+def merge_totals(total, chunk_total):
+    """累加两份 totals；total 为 None 时直接返回 chunk_total"""
+    if total is None:
+        return chunk_total
+    return total.add(chunk_total, fill_value=0)
+
+def means_from_totals(totals):
+    """由 totals 计算均值（保留两位小数），无有效数据的维度不出现在结果中"""
+    if totals is None:
+        return {}
+    valid = totals[totals['count'] > 0]
+    return {
+        name: round(float(row['sum'] / row['count']), 2)
+        for name, row in valid.iterrows()
+    }
+
+def dimension_means(table):
+    """向量化计算各维度的平均情感得分（保留两位小数），未命中的维度不出现在结果中"""
+    return means_from_totals(dimension_totals(table))
+
+def extract_tags_with_scores(comments, workers=None):
+    """从评论中提取标签并计算情感得分"""
+    return dimension_means(analyze_comments(comments, workers=workers))
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+评论分析结果库
+以“词库版本 + 规范化评论文本”的哈希为键，把每条评论的分析结果（flags、sentiment）持久化到 SQLite。
+每天重新上传累计导出的评论表时，只有库中没有的评论需要分词分析，其余直接读取。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from analysis import dedupe_comments
+from lexicon import LEXICON_VERSION
+
+STORE_PATH = os.getenv("ANALYSIS_STORE_PATH", os.path.join(".cache", "analysis_store.sqlite3"))
+LOOKUP_BATCH = 500  # 每条 SELECT ... IN 查询的键数
+
+def comment_key(text, version=LEXICON_VERSION):
+    """单条评论的键：词库版本与规范化评论文本的 16 字节 BLAKE2b 摘要；词库变化后旧结果自然失效"""
+    return hashlib.blake2b(f"{version}\x00{text}".encode('utf-8'), digest_size=16).digest()
+
+class AnalysisStore:
+    """按评论内容哈希存取分析结果的 SQLite 库（线程安全）"""
+
+    def __init__(self, path=STORE_PATH, version=LEXICON_VERSION):
+        self.version = version
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS comments ("
+            "key BLOB PRIMARY KEY, version TEXT NOT NULL, flags INTEGER NOT NULL, sentiment REAL NOT NULL)"
+        )
+        # 词库已更新：旧版本的结果不会再被命中，直接清理
+        self._conn.execute("DELETE FROM comments WHERE version != ?", (version,))
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """批量查询，返回 {键: (flags, sentiment)}，未命中的键不出现在结果中"""
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, flags, sentiment FROM comments WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                for key, flags, sentiment in rows:
+                    found[key] = (flags, sentiment)
+        return found
+
+    def put_many(self, items):
+        """批量写入 (键, flags, sentiment)，同一事务内完成"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO comments (key, version, flags, sentiment) VALUES (?, ?, ?, ?)",
+                ((key, self.version, int(flags), float(sentiment)) for key, flags, sentiment in items)
+            )
+            self._conn.commit()
+
+    def size(self):
+        """库中的评论条数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+
+def analyze_incremental(comments, store, analyze):
+    """
+    增量分析：评论先规范化去重，再按内容哈希查库，只把库中没有的不重复文本交给 analyze
+    （如 analyze_comments）分析并写回，最后按出现次数展开回每一行
+    返回 (结果表, 统计)；结果表格式与 analyze_comments 相同、与输入索引对齐，
+    统计为 dict(rows=总行数, unique=不重复文本数, new=本次新分析的文本数, keys=不重复文本的内容哈希列表)；
+    分块调用时可用 keys 跨块累计整个文件的不重复文本数
+    """
+    codes, texts = dedupe_comments(comments)
+    keys = [comment_key(text) for text in texts]
+    known = store.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in known]
+    metrics.incr("analysis_store_hits", len(keys) - len(missing))
+    metrics.incr("analysis_store_misses", len(missing))
+
+    unique_flags = np.zeros(len(keys) + 1, dtype=np.uint16)    # 末尾一项对应空评论（code 为 -1）
+    unique_sentiment = np.full(len(keys) + 1, np.nan, dtype=np.float32)
+    for i, key in enumerate(keys):
+        if key in known:
+            unique_flags[i], unique_sentiment[i] = known[key]
+    if missing:
+        fresh = analyze(pd.Series([texts[i] for i in missing]))
+        unique_flags[missing] = fresh['flags'].to_numpy()
+        unique_sentiment[missing] = fresh['sentiment'].to_numpy()
+        store.put_many((keys[i], unique_flags[i], unique_sentiment[i]) for i in missing)
+
+    table = pd.DataFrame({'flags': unique_flags[codes], 'sentiment': unique_sentiment[codes]}, index=comments.index)
+    return table, {'rows': len(codes), 'unique': len(keys), 'new': len(missing), 'keys': keys}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_analysis_store():
+    """进程内共享的分析结果库，首次调用时创建"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AnalysisStore()
+    return _store
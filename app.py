@@ -5,18 +5,16 @@
 """
 
 import streamlit as st
-import pandas as pd
-import numpy as np
-import math
-import re
-import matplotlib.pyplot as plt
-from collections import defaultdict
-from io import BytesIO
-import base64
-import jieba
-import time
 import os
-import requests
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import metrics
+from cache import LRUCache, content_hash
+from reply_cache import get_reply_cache
+
+# 评分计算器只依赖上面的轻量模块；pandas/matplotlib/jieba 等重依赖在各页面内按需导入
+_SCRIPT_START = time.perf_counter()
 
 # ==================== 页面配置 ====================
 st.set_page_config(page_title="Hotel OTA 运营系统", layout="wide")
@@ -44,317 +42,301 @@ if 'current_reply_index' not in st.session_state:
 if 'clipboard' not in st.session_state:
     st.session_state.clipboard = ""
 
-# ==================== 工具函数：Excel 导出 ====================
-def to_excel(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='原始数据')
-    return output.getvalue()
-
-# ==================== 工具函数：情感分析与标签提取 ====================
-TAG_KEYWORDS = {
-    '位置': ['位置', '地段', '周边', '附近', '离', '靠近', '市中心', '地铁', '公交'],
-    '交通': ['交通', '打车', '停车', '驾车', '机场', '车站', '接驳'],
-    '早餐': ['早餐', '早饭', '餐饮', 'buffet', '餐食', '自助餐'],
-    '安静': ['安静', '噪音', '吵', '吵闹', '隔音', '清静', '安静房'],
-    '床舒适': ['床', '床垫', '睡感', '舒服', '舒不舒服', '软硬', '枕头'],
-    '房间大小': ['房间小', '房间大', '空间', '拥挤', '宽敞', '面积', '局促'],
-    '视野': ['视野', '景观', '江景', '海景', '窗景', '朝向', '夜景', 'view'],
-    '性价比': ['性价比', '价格', '划算', '贵', '便宜', '值', '物超所值'],
-    '网络': ['Wi-Fi', '网络', '信号', '上网', '网速', 'wifi', '无线']
-}
-
-POSITIVE_WORDS = {'好', '棒', '赞', '满意', '不错', '推荐', '惊喜', '舒服', '完美', '贴心',
-                  '干净', '方便', '快捷', '温馨', '柔软', '丰富', '齐全', '优质', '热情'}
-NEGATIVE_WORDS = {'差', '糟', '烂', '坑', '差劲', '失望', '糟糕', '难用', '吵', '脏',
-                  '贵', '偏', '慢', '不值', '问题', '敷衍', '拖延', '恶劣'}
-
-def preprocess(text):
-    """文本预处理：去除非中文/英文字符，分词"""
-    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z]', '', str(text).lower())
-    words = jieba.lcut(text)
-    return [w for w in words if len(w) >= 2]
-
-def get_sentiment_score(text):
-    """基于关键词的情感分析"""
-    words = preprocess(text)
-    pos_count = sum(1 for w in words if w in POSITIVE_WORDS)
-    neg_count = sum(1 for w in words if w in NEGATIVE_WORDS)
-    total = pos_count + neg_count
-    if total == 0:
-        return 3.8
-    if pos_count > neg_count:
-        return min(5.0, 4.5 + 0.5 * (pos_count / total))
-    elif neg_count > pos_count:
-        return max(1.0, 2.5 - 0.5 * (neg_count / total))
-    else:
-        return 3.8
-
-def extract_tags_with_scores(comments):
-    """从评论中提取标签并计算情感得分"""
-    tag_scores = defaultdict(list)
-    for comment in comments.dropna():
-        for tag, keywords in TAG_KEYWORDS.items():
-            if any(kw in str(comment) for kw in keywords):
-                score = get_sentiment_score(str(comment))
-                tag_scores[tag].append(score)
-    final_scores = {
-        tag: round(sum(scores) / len(scores), 2)
-        for tag, scores in tag_scores.items()
-        if len(scores) > 0
-    }
-    return final_scores
-
-# ==================== 新增：提取评论维度与情感 ====================
-def extract_aspects_and_sentiment(text):
+# ==================== 工具函数：冷启动预热与计时 ====================
+@st.cache_resource
+def startup_timings():
+    """进程级冷启动耗时记录（秒）：首次渲染、词典预热、首次分析"""
+    return {}
+
+def _warm_up(timings):
+    from analysis import warm_up
+    timings['词典预热'] = warm_up()
+
+@st.cache_resource
+def analysis_warmup():
+    """每个进程只执行一次：在后台线程加载 jieba 词典，页面照常渲染，首个分析请求无需再等待"""
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+    future = executor.submit(_warm_up, startup_timings())
+    executor.shutdown(wait=False)
+    return future
+
+# ==================== 工具函数：评分汇总与图表 ====================
+ANALYSIS_CACHE_ENTRIES = 8  # 最多缓存的上传文件分析结果数
+
+@st.cache_resource
+def analysis_cache():
+    """进程内共享的分析结果缓存，键为（上传内容哈希, 词库版本）"""
+    return LRUCache(max_entries=ANALYSIS_CACHE_ENTRIES)
+
+def upload_digest(uploaded_file):
+    """上传文件的内容哈希；同一次上传只计算一次，后续重跑直接复用"""
+    digests = st.session_state.setdefault('upload_digests', {})
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id not in digests:
+        digests.clear()
+        digests[file_id] = content_hash(uploaded_file.getbuffer())
+    return digests[file_id]
+
+CHART_CACHE_ENTRIES = 32    # 最多缓存的柱状图 PNG 数
+EXCELLENT_LINE = 4.78       # 优秀线
+CHART_MODES = ["原生（矢量）", "图片（PNG）"]
+
+@st.cache_resource
+def chart_cache():
+    """进程内共享的柱状图 PNG 缓存，键为评分序列内容"""
+    return LRUCache(max_entries=CHART_CACHE_ENTRIES)
+
+def scores_key(all_scores):
+    """评分序列的内容键：维度与分数（保留 6 位小数）组成的元组"""
+    return tuple((name, round(float(score), 6)) for name, score in all_scores.items())
+
+def render_chart_png(all_scores):
     """
-    从评论中提取涉及的维度（aspects）和整体情感倾向
-    返回：dict(aspects=list, sentiment=str, has_complaint=bool, has_praise=bool, has_facility_issue=bool, has_noise=bool)
+    绘制评分柱状图并导出为 PNG 字节
+    直接使用 Figure 对象而不经过 pyplot，图像不会登记到全局图像管理器，导出后即可被回收
     """
-    text_lower = str(text).lower()
-    aspects = []
-    has_complaint = False
-    has_praise = False
-    has_facility_issue = False
-    has_noise = False
-
-    for aspect, keywords in TAG_KEYWORDS.items():
-        if any(kw in text_lower for kw in keywords):
-            aspects.append(aspect)
-
-    pos_count = sum(1 for word in POSITIVE_WORDS if word in text_lower)
-    neg_count = sum(1 for word in NEGATIVE_WORDS if word in text_lower)
-
-    if neg_count > pos_count:
-        sentiment = "负面"
-        has_complaint = True
-    elif pos_count > neg_count:
-        sentiment = "正面"
-        has_praise = True
-    else:
-        sentiment = "中性"
-
-    if any(kw in text_lower for kw in ['旧', '坏', '损坏', '故障', '设施陈旧', '设备老化']):
-        has_facility_issue = True
-    if any(kw in text_lower for kw in ['吵', '噪音', '隔音', '安静']):
-        has_noise = True
+    from io import BytesIO
+    from matplotlib.figure import Figure
+    fig1 = Figure(figsize=(10, 6))
+    ax1 = fig1.subplots()
+    colors = ['green' if v >= EXCELLENT_LINE else 'red' for v in all_scores.values]
+    all_scores.plot(kind='bar', ax=ax1, color=colors, alpha=0.8)
+    ax1.set_ylabel("评分（满分5.0）")
+    ax1.set_ylim(4.5, 5.0)
+    ax1.axhline(y=EXCELLENT_LINE, color='orange', linestyle='--', linewidth=1)
+    ax1.text(0.02, 4.8, f'优秀线 {EXCELLENT_LINE}', transform=ax1.transData, fontsize=10, color='orange')
+    ax1.tick_params(axis='x', labelrotation=45)
+    for label in ax1.get_xticklabels():
+        label.set_horizontalalignment('right')
+    fig1.tight_layout()
+    output = BytesIO()
+    with metrics.span("chart_render"):
+        fig1.savefig(output, format='png', dpi=200, bbox_inches='tight')
+    fig1.clear()
+    return output.getvalue()
 
+def chart_png(all_scores):
+    """按评分内容缓存的 PNG：相同评分只绘制一次"""
+    key = scores_key(all_scores)
+    png = chart_cache().get(key)
+    if png is None:
+        png = render_chart_png(all_scores)
+        chart_cache().put(key, png)
+    return png
+
+def score_chart_spec(all_scores):
+    """评分柱状图的 Vega-Lite 描述：由浏览器绘制矢量图，服务端无需栅格化"""
     return {
-        'aspects': aspects,
-        'sentiment': sentiment,
-        'has_complaint': has_complaint,
-        'has_praise': has_praise,
-        'has_facility_issue': has_facility_issue,
-        'has_noise': has_noise
-    }
-
-# ==================== 优化建议库 ====================
-SUGGESTIONS = {
-    '位置': '优化导航信息，与周边商圈合作提供折扣弥补位置短板。',
-    '交通': '提供免费接驳车或与打车平台合作，提升客人便利性。',
-    '早餐': '丰富早餐品类，增加本地特色和健康选项，提升餐品温度。',
-    '安静': '优化隔音设计，更换密封性更好的门窗，减少噪音干扰。',
-    '床舒适': '升级床垫与床品材质，提供软硬两种枕头供客人选择。',
-    '房间大小': '优化小房型空间布局，推出“大房型优先升级”优惠活动。',
-    '视野': '定期清洁窗户与阳台，避免景观遮挡，拍摄高质量宣传图。',
-    '性价比': '调整价格策略，推出不同时段优惠套餐，增加增值服务。',
-    '网络': '升级Wi-Fi带宽，确保全区域稳定覆盖，设置一键连接页面。',
-    '设施': '定期检修设备运行状态，补充人性化设施如USB充电口、小冰箱，增设无障碍通道。',
-    '卫生': '加强清洁流程监督，使用可视化清洁标准，重点消毒高频接触区域。',
-    '环境': '优化公共区域绿植布置，统一装修风格提升质感，营造主题化空间氛围。',
-    '服务': '加强员工服务礼仪培训，建立快速响应机制，推行个性化主动服务。'
-}
-
-# ==================== 智能评论回复相关函数 ====================
-def generate_prompt(review: str, guest_name: str, hotel_name: str, hotel_nickname: str, review_source: str, hotel_location: str, style: str = "标准"):
-    """生成给大模型的提示词（支持风格）"""
-    info = extract_aspects_and_sentiment(review)
-
-    # 标签系统
-    tag_map = {
-        '交通': '【❤️交通便利❤️】',
-        '服务': '【❤️服务周到❤️】',
-        '卫生': '【✅干净整洁✅】',
-        '早餐': '【🍳早餐可口🍳】',
-        '性价比': '【💰性价比高💰】',
-        '环境': '【🌿安静舒适🌿】',
-        '设施': '【🔧设施完善🔧】'
+        "data": {"values": [{"维度": name, "评分": float(score)} for name, score in all_scores.items()]},
+        "height": 360,
+        "layer": [
+            {
+                "mark": {"type": "bar", "opacity": 0.8, "clip": True},
+                "encoding": {
+                    "x": {"field": "维度", "type": "nominal", "sort": None, "axis": {"labelAngle": -45}},
+                    "y": {"field": "评分", "type": "quantitative", "scale": {"domain": [4.5, 5.0]},
+                          "title": "评分（满分5.0）"},
+                    "color": {"condition": {"test": f"datum['评分'] >= {EXCELLENT_LINE}", "value": "green"},
+                              "value": "red"},
+                    "tooltip": [{"field": "维度"}, {"field": "评分", "format": ".2f"}]
+                }
+            },
+            {
+                "mark": {"type": "rule", "color": "orange", "strokeDash": [4, 4]},
+                "encoding": {"y": {"datum": EXCELLENT_LINE}}
+            }
+        ]
     }
-    tags = "".join(tag_map.get(aspect, "") for aspect in info['aspects'])
-    if not tags or info['sentiment'] == "负面":
-        tags = "【🏨舒适入住🏨】"
-
-    # 情感导向
-    sentiment_guidance = ""
-    if info['sentiment'] == "正面":
-        sentiment_guidance = "客人对本次入住体验表示满意，重点表扬了某些方面。请表达感谢，并强调我们始终致力于提供高品质服务。"
-    elif info['sentiment'] == "负面":
-        sentiment_guidance = "客人对本次入住存在不满，可能涉及服务、设施或环境问题。请首先诚恳道歉，说明已记录反馈并正在改进，展现酒店的责任感与改进决心。"
-    else:
-        sentiment_guidance = "客人评论较为中立，未明确表达强烈情感。请表达欢迎与感谢，传递酒店的温暖与专业形象。"
-
-    # 风格化指导
-    style_guidance = {
-        "正式": "语气正式、专业、得体，适合高端酒店或负面评论。",
-        "亲切": "语气温暖、真诚、带人情味，适合家庭型酒店。",
-        "幽默": "适当使用轻松幽默的语言，但不轻浮，适合年轻客群。",
-        "文艺": "使用优美、有画面感的语言，适合景区/度假酒店。",
-        "简洁": "语言简练，重点突出，适合快速回复场景。"
-    }
-
-    additional_notes = []
-    if info['has_complaint']:
-        additional_notes.append("注意：评论中包含负面反馈，请避免过度赞美，优先体现关怀与改进态度。")
-    if info['has_praise']:
-        additional_notes.append("注意：评论中包含明确表扬，请具体回应并表达感谢。")
-    if info['has_facility_issue']:
-        additional_notes.append("提及设施陈旧或损坏，请回应‘已反馈工程部评估升级’或类似表述。")
-    if info['has_noise']:
-        additional_notes.append("提及噪音问题，请承诺‘加强隔音管理’或‘优化客房分配策略’。")
 
-    prompt = f"""
-    【角色设定】
-    你是 {hotel_name} 的官方客服代表，昵称为“{hotel_nickname}”。你正在回复一位客人在 {review_source} 平台发布的评论。
-
-    【酒店地理位置】
-    {hotel_location}。请根据此信息灵活回应，如：
-    - 若位置优越：可表达“感谢您认可我们优越的地理位置”
-    - 若位置偏僻：可说明“虽地处安静区域，我们将持续优化交通指引”
-    - 若近地铁/景区：可强调“便捷的交通/步行即可抵达景点”
-
-    【任务要求】
-    请撰写一条{style_guidance.get(style, '标准')}中文回复，用于公开发布。必须满足以下所有规则：
-
-    1. 开头必须包含以下标签：
-       {tags}
+def render_scores(all_scores, chart_slot, table_slot, chart_mode=CHART_MODES[0]):
+    """在占位区域中显示（或刷新）评分柱状图与详情表"""
+    import pandas as pd
+    with chart_slot.container():
+        # 调整列的比例，使柱状图占据更多空间
+        col1, _ = st.columns([3, 1])
+        with col1:
+            st.subheader("📊 各维度评分分布")
+            if chart_mode == CHART_MODES[0]:
+                st.vega_lite_chart(spec=score_chart_spec(all_scores), width="stretch")
+            else:
+                st.image(chart_png(all_scores), width="stretch")
 
-    2. 称呼方式（二选一）：
-       - 若评论含表扬：使用“亲爱的{guest_name}”；
-       - 否则：使用“尊敬的宾客”。
+    with table_slot.container():
+        st.markdown("### 🔽 各维度评分详情")
+        df_table = pd.DataFrame(list(all_scores.items()), columns=["维度", "评分"])
+        st.table(df_table)
 
-    3. 回复语气必须符合以下情感导向：
-       {sentiment_guidance}
+def analyze_upload(uploaded_file, workers, preview_slot, progress_slot, chart_slot, table_slot, chart_mode=CHART_MODES[0]):
+    """
+    分块读取并分析上传的 Excel，边分析边刷新预览、进度与图表
+    返回值同 pipeline.analyze_workbook
+    """
+    from pipeline import analyze_workbook
+
+    progress = progress_slot.progress(0.0, text="⏳ 正在分块读取并分析评论...")
+    preview_shown = False
+
+    def on_chunk(result, total_rows):
+        nonlocal preview_shown
+        if not preview_shown:
+            with preview_slot.expander("📄 数据预览"):
+                st.dataframe(result['preview'])
+            preview_shown = True
+        if len(result['scores']) > 0:
+            render_scores(result['scores'], chart_slot, table_slot, chart_mode)
+        n_rows = result['n_rows']
+        if total_rows:
+            progress.progress(min(n_rows / total_rows, 1.0), text=f"⏳ 已分析 {n_rows} / {total_rows} 条评论")
+        else:
+            progress.progress(0.0, text=f"⏳ 已分析 {n_rows} 条评论")
 
-    4. 内容结构建议：
-       - 正面评论：感谢 → 具体回应表扬点 → 结合地理位置说明优势 → 表达持续努力的决心 → 邀请再次光临
-       - 负面评论：致歉 → 承认问题 → 说明改进措施 → 可提及位置优势弥补短板 → 邀请再次体验
-       - 中性评论：感谢 → 简要回应内容 → 提及位置便利性 → 表达欢迎之意
+    result = analyze_workbook(uploaded_file, workers=workers, on_chunk=on_chunk)
+    progress_slot.empty()
+    return result
 
-    5. 字数严格控制在 200–250 个汉字之间（不含标签）。
-    6. 禁止使用过度夸张词汇（如“极其”“完美”）。
-    7. 结尾必须包含类似“期待您再次光临，祝您生活愉快！”的表达。
-    8. 不提及 API、模型、技术细节或内部流程。
+# ==================== 工具函数：维度趋势 ====================
+TREND_DEFAULT_DIMS = 5     # 默认显示样本最多的前几个维度
 
-    【附加提示】
-    {' '.join(additional_notes) if additional_notes else '无特殊注意事项。'}
+def render_trends(daily, date_col):
+    """维度趋势图：切换粒度、滚动窗口与日期范围只在分析时预先汇总的日汇总表上重新计算，不重新扫描评论"""
+    from trends import FREQUENCIES, date_range, trend_frame
 
-    【客人原始评论】
-    {review}
+    first, last = date_range(daily)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        granularity = st.radio("粒度", list(FREQUENCIES), index=1, horizontal=True, key="trend_freq")
+    freq, unit = FREQUENCIES[granularity]
+    with col2:
+        window = st.number_input(f"滚动窗口（{unit}）", 1, 52, 1, 1, key="trend_window",
+                                 help="每个点汇总最近若干期的全部评价，按样本数加权平均，曲线更平滑")
+    with col3:
+        min_count = st.number_input("每期最少样本数", 1, 1000, 5, 1, key="trend_min_count",
+                                    help="样本数不足的期不显示，避免个别评价造成大幅波动")
+    if first < last:
+        start, end = st.slider("日期范围", min_value=first, max_value=last, value=(first, last), key="trend_range")
+    else:
+        start, end = first, last
+
+    means, counts = trend_frame(daily, freq, window, start, end, min_count)
+    ranked = list(counts.sum().sort_values(ascending=False).index)
+    dims = st.multiselect("维度", ranked, default=ranked[:TREND_DEFAULT_DIMS], key="trend_dims")
+    st.caption(f"📅 日期列：{date_col} · {start} 至 {end} · 共 {len(means)} 期")
+    if dims:
+        st.line_chart(means[dims])
+    with st.expander("📋 趋势明细（含每期样本数）"):
+        st.dataframe(means.join(counts, rsuffix="·样本数"))
+
+# ==================== 工具函数：评分情景规划 ====================
+def parse_numbers(text):
+    """解析逗号/空格分隔的正数列表，忽略无法识别的项"""
+    values = []
+    for part in text.replace('，', ',').replace(',', ' ').split():
+        try:
+            value = float(part)
+        except ValueError:
+            continue
+        if value > 0:
+            values.append(value)
+    return values
+
+def render_planner(current_score, total_reviews, target_score):
+    """情景规划：对单店或上传的酒店清单，按目标评分 × 评价结构 × 日均评价数整表计算所需评价数与天数"""
+    import numpy as np
+    import pandas as pd
+    from ingest import read_review_sheet
+    from planner import REVIEW_MIXES, normalize_portfolio, sweep, time_to_target_curves
+
+    st.divider()
+    st.subheader("📐 情景规划")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        low, high = st.slider("目标评分范围", 4.0, 4.99, (min(target_score, 4.99) - 0.1, min(target_score, 4.99)), 0.01)
+        step = st.number_input("目标评分步长", 0.01, 0.5, 0.05, 0.01)
+    with col2:
+        mix_names = st.multiselect("新增评价结构", list(REVIEW_MIXES), default=list(REVIEW_MIXES)[:2])
+    with col3:
+        velocity_text = st.text_input("日均新增评价数（逗号分隔）", "2, 5, 10")
+    portfolio_file = st.file_uploader("上传酒店清单（可选，含 酒店名称/当前评分/评价数 列）", type=["xlsx", "csv"])
 
-    请直接输出最终回复内容，不要包含“回复：”等前缀。
-    """
-    return prompt
+    velocities = parse_numbers(velocity_text)
+    if not mix_names or not velocities:
+        st.info("请至少选择一种评价结构并填写日均新增评价数。")
+        return
+    targets = np.round(np.arange(low, high + step / 2, step), 2)
 
-def call_qwen_api(prompt: str, api_key: str) -> str:
-    """调用通义千问API"""
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
-    payload = {
-        "model": "qwen-max",
-        "input": {
-            "messages": [{"role": "user", "content": prompt}]
-        },
-        "parameters": {
-            "result_format": "text",
-            "max_tokens": 300,
-            "temperature": 0.6,
-            "top_p": 0.85
-        }
-    }
     try:
-        response = requests.post("https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
-                               headers=headers, json=payload, timeout=30)
-        if response.status_code == 200:
-            result = response.json()
-            return result['output']['text'].strip()
+        if portfolio_file:
+            hotels = normalize_portfolio(read_review_sheet(portfolio_file, portfolio_file.name))
         else:
-            return f"❌ API 错误 [{response.status_code}]：{response.text}"
+            hotels = pd.DataFrame({'酒店名称': [st.session_state.hotel_name],
+                                   '当前评分': [current_score], '评价数': [total_reviews]})
+        start = time.perf_counter()
+        result = sweep(hotels, targets, {name: REVIEW_MIXES[name] for name in mix_names}, velocities)
+        elapsed = time.perf_counter() - start
     except Exception as e:
-        return f"🚨 请求失败：{str(e)}"
+        st.error(f"❌ 规划失败：{str(e)}")
+        return
+
+    st.caption(f"共 {len(hotels)} 家酒店 · {len(result)} 个情景，计算耗时 {elapsed * 1000:.1f} ms；空白表示该结构的平均星级不高于目标，无法达到")
+    hotel = st.selectbox("查看酒店", hotels['酒店名称'].unique()) if len(hotels) > 1 else hotels['酒店名称'].iloc[0]
+    st.markdown("**达到各目标评分所需天数**")
+    st.line_chart(time_to_target_curves(result, hotel))
+    st.dataframe(result[result['酒店名称'] == hotel], hide_index=True)
+    st.download_button("📥 下载全部情景 (.csv)", lambda: result.to_csv(index=False).encode('utf-8-sig'),
+                       file_name="评分情景规划.csv", mime="text/csv", on_click="ignore")
+
+# ==================== 工具函数：API Key ====================
+def require_api_key():
+    """统一从 secrets 或环境变量获取 API Key；无效时提示设置方法并停止渲染"""
+    try:
+        api_key = st.secrets["QWEN_API_KEY"]
+    except KeyError:
+        api_key = os.getenv("QWEN_API_KEY")
 
-def truncate_to_word_count(text: str, min_words=200, max_words=250, prompt="", api_key="") -> str:
-    """
-    智能调节文本长度至指定范围（200-250字）
-    - 若过长：智能截断至最近的句末标点
-    - 若过短：调用大模型补写至目标长度
-    """
-    # 清理文本，只保留有效字符
-    valid_chars = '，。！？；：""''（）【】《》、'
-    chars = [c for c in text if c.isalnum() or c in valid_chars]
-    content = ''.join(chars)
-    word_count = len(content)
-
-    # 情况1：字数在合理范围内，优先尝试自然截断
-    if word_count <= max_words:
-        if word_count >= min_words:
-            return content  # 正好在范围内
-
-        # 字数不足，需要补全
-        if not prompt or not api_key:
-            # 降级处理：简单重复末尾句式（仅应急）
-            last_sentence = ""
-            for punct in ['。', '！', '？']:
-                if punct in content:
-                    last_sentence = content.rsplit(punct, 1)[1] + punct
-                    break
-            padding = last_sentence * ((min_words - word_count) // len(last_sentence) + 1)
-            result = (content + padding)[:max_words]
-            return result[:result.rfind('。') + 1] if '。' in result else result
-
-        # 调用大模型补写
-        extend_prompt = f"""
-        请将以下客服回复自然地扩展至200-250字，保持原有风格和信息，可补充对酒店服务、环境或地理位置的描述，但不要改变原意或添加虚构信息：
-
-        {content}
-
-        请直接输出扩展后的完整回复。
-        """
-        extended = call_qwen_api(extend_prompt, api_key)
-        # 再次清理和截断
-        ext_chars = [c for c in extended if c.isalnum() or c in valid_chars]
-        ext_content = ''.join(ext_chars)
-        
-        if len(ext_content) > max_words:
-            # 智能截断
-            truncated = ext_content[:max_words]
-            for punct in ['。', '！', '？']:
-                if punct in truncated:
-                    last_punct = truncated.rfind(punct) + 1
-                    if last_punct >= min_words:
-                        truncated = truncated[:last_punct]
-                        break
-            return truncated
-        elif len(ext_content) < min_words:
-            # 再次补全失败，使用降级方案
-            return truncate_to_word_count(ext_content, min_words, max_words)  # 递归调用降级模式
+    if not api_key or not api_key.startswith("sk-"):
+        st.warning("⚠️ 请设置有效的 Qwen API Key")
+        st.markdown("""
+        **设置方法：**
+        1. 在 Streamlit Cloud 的应用设置中打开 **Secrets**；
+        2. 添加：`QWEN_API_KEY = "sk-你的密钥"`；
+        3. 重新部署。
+        """)
+        st.stop()
+    return api_key
+
+# ==================== 工具函数：共享限流排队 ====================
+QUEUE_POLL_SECONDS = 0.3    # 排队位置的刷新间隔
+
+def bind_session_client():
+    """以本会话为模型请求的调用方：进程级限流在各会话之间轮流放行"""
+    import uuid
+    from qwen_client import CLIENT_ID
+    CLIENT_ID.set(st.session_state.setdefault('client_id', uuid.uuid4().hex))
+
+def show_queue_position(status, idle_text=None):
+    """在 status 占位区域显示本会话在共享限流队列中的位置；未在排队时显示 idle_text（为空则清空）"""
+    from qwen_client import LIMITER
+    position = LIMITER.queue_position()
+    if position is None:
+        if idle_text:
+            status.caption(idle_text)
         else:
-            return ext_content
-
-    # 情况2：字数过长，智能截断
+            status.empty()
+    elif position == 0:
+        status.caption("🚦 排队中：下一个就轮到您")
     else:
-        truncated = content[:max_words]
-        for punct in ['。', '！', '？']:
-            if punct in truncated:
-                last_punct = truncated.rfind(punct) + 1
-                if last_punct >= min_words:
-                    truncated = truncated[:last_punct]
-                    break
-        # 确保不低于最小值
-        if len(truncated) < min_words:
-            truncated = content[:max_words]
-        return truncated
+        status.caption(f"🚦 排队中：前面还有 {position} 位用户的请求（共 {LIMITER.waiting()} 个请求等待）")
+
+def run_with_queue_feedback(fn, *args, **kwargs):
+    """在后台线程执行 fn 并返回其结果，等待期间显示本会话在共享限流队列中的位置"""
+    from qwen_client import submit
+    status = st.empty()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = submit(pool, fn, *args, **kwargs)
+        while not wait([future], timeout=QUEUE_POLL_SECONDS).done:
+            show_queue_position(status)
+    status.empty()
+    return future.result()
 
 # ==================== 主页面逻辑 ====================
 
@@ -364,7 +346,8 @@ page = st.sidebar.radio("选择功能", [
     "📊 携程评分提升计算器",
     "📊 美团评分提升计算器",
     "📈 评论维度分析",
-    "💬 智能评论回复"
+    "💬 智能评论回复",
+    "📦 批量评论回复"
 ])
 
 # 全局配置
@@ -387,6 +370,7 @@ if st.sidebar.button("💾 保存配置"):
 # ============ 1. 携程评分计算器 ============
 if page == "📊 携程评分提升计算器":
     st.title("📊 携程评分提升计算器")
+    from planner import required_five_star
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -396,18 +380,8 @@ if page == "📊 携程评分提升计算器":
     with col3:
         target_score = st.number_input("目标评分", 0.0, 5.0, 4.80, 0.01)
 
-    def calculate_simple():
-        if current_score >= target_score:
-            return 0
-        numerator = (target_score - current_score) * total_reviews
-        denominator = 5.0 - target_score
-        if denominator <= 0:
-            raise ValueError("目标评分必须小于5.0")
-        required = math.ceil(numerator / denominator)
-        return max(0, required)
-
     try:
-        req = calculate_simple()
+        req = required_five_star(current_score, total_reviews, target_score)
         if req == 0:
             st.info(f"🎉 当前评分 **{current_score:.2f}** 已达到或超过目标 **{target_score:.2f}**")
         else:
@@ -415,9 +389,12 @@ if page == "📊 携程评分提升计算器":
     except Exception as e:
         st.error(f"❌ 计算错误：{str(e)}")
 
+    render_planner(current_score, total_reviews, target_score)
+
 # ============ 2. 美团评分计算器 ============
 elif page == "📊 美团评分提升计算器":
     st.title("美团酒店评分提升计算器（简化版）")
+    from planner import required_five_star
 
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -427,18 +404,8 @@ elif page == "📊 美团评分提升计算器":
     with col3:
         target_score = st.number_input("目标评分", 0.0, 5.0, 4.80, 0.01)
 
-    def calculate_simple():
-        if current_score >= target_score:
-            return 0
-        numerator = (target_score - current_score) * total_reviews
-        denominator = 5.0 - target_score
-        if denominator <= 0:
-            raise ValueError("目标评分必须小于 5.0")
-        required = math.ceil(numerator / denominator)
-        return max(0, required)
-
     try:
-        req = calculate_simple()
+        req = required_five_star(current_score, total_reviews, target_score)
         if req == 0:
             st.info(f"🎉 当前评分 **{current_score:.2f}** 已达到或超过目标 **{target_score:.2f}**")
         else:
@@ -446,9 +413,17 @@ elif page == "📊 美团评分提升计算器":
     except Exception as e:
         st.error(f"❌ 计算错误：{str(e)}")
 
+    render_planner(current_score, total_reviews, target_score)
+
 # ============ 3. 评论维度分析 ============
 elif page == "📈 评论维度分析":
     st.title("📈 评论维度分析（基于文本挖掘）")
+    from io import BytesIO
+    import pandas as pd
+    from analysis import DEFAULT_WORKERS, SUGGESTIONS
+    from lexicon import LEXICON_VERSION
+    from pipeline import load_result, save_result
+    warmup = analysis_warmup()
 
     st.markdown("上传包含 **评论内容** 列的 Excel 文件，系统将自动提取标签并分析情感。")
 
@@ -458,65 +433,60 @@ elif page == "📈 评论维度分析":
         }))
 
     uploaded_file = st.file_uploader("上传评论数据 (.xlsx)", type=["xlsx"])
+    workers = st.number_input(
+        "并行进程数", 1, os.cpu_count() or 1, min(DEFAULT_WORKERS, os.cpu_count() or 1), 1,
+        help="评论较多时拆分到多个进程并行分词；数据量较小时自动串行处理"
+    )
+    chart_mode = st.radio("图表渲染", CHART_MODES, horizontal=True,
+                          help="原生：浏览器绘制矢量图，服务端不占用绘图内存；图片：服务端绘制 PNG（按评分缓存）")
 
     if uploaded_file:
         try:
-            df = pd.read_excel(uploaded_file)
-            st.success(f"✅ 成功加载 {len(df)} 条评论数据")
-
-            with st.expander("📄 数据预览"):
-                st.dataframe(df.head())
-
-            comment_col = None
-            if '评论内容' in df.columns:
-                comment_col = '评论内容'
+            loaded_slot = st.empty()
+            preview_slot = st.empty()
+            progress_slot = st.empty()
+            chart_slot = st.empty()
+            table_slot = st.empty()
+
+            # 同一文件（内容哈希 + 词库版本相同）只分析一次，之后的重跑直接读取缓存
+            digest = upload_digest(uploaded_file)
+            cache_key = (digest, LEXICON_VERSION)
+            result = analysis_cache().get(cache_key)
+            if result is None:
+                # 命令行（cli.py analyze）已在后台分析过的文件直接载入结果
+                result = load_result(digest)
+                if result is not None:
+                    analysis_cache().put(cache_key, result)
+                    st.caption("📦 已载入后台预先分析的结果")
+            if result is None:
+                warmup.result()
+                analysis_start = time.perf_counter()
+                result = analyze_upload(uploaded_file, workers, preview_slot, progress_slot, chart_slot, table_slot,
+                                        chart_mode)
+                startup_timings().setdefault('首次分析', time.perf_counter() - analysis_start)
+                if result['comment_col']:
+                    analysis_cache().put(cache_key, result)
+                    save_result(digest, result)
             else:
-                potential = [col for col in df.columns if '评论' in col or '评价' in col or 'content' in col]
-                if potential:
-                    comment_col = potential[0]
+                with preview_slot.expander("📄 数据预览"):
+                    st.dataframe(result['preview'])
+                if len(result['scores']) > 0:
+                    render_scores(result['scores'], chart_slot, table_slot, chart_mode)
+
+            comment_col = result['comment_col']
+            all_scores = result['scores']
 
             if not comment_col:
                 st.error("❌ 未找到评论列，请确保包含“评论”或“评价”关键词的列。")
             else:
-                # 提取评论内容中的标签评分
-                new_scores = extract_tags_with_scores(df[comment_col])
-
-                # 读取Excel中已有的维度评分（示例）
-                dimension_cols = ['设施', '卫生', '环境', '服务']
-                existing_scores = {}
-                for col in dimension_cols:
-                    if col in df.columns:
-                        mean_val = df[col].mean()
-                        if not pd.isna(mean_val):
-                            existing_scores[col] = round(mean_val, 2)
-
-                # 合并新旧评分
-                all_scores = {**new_scores, **existing_scores}
+                loaded_slot.success(f"✅ 成功加载 {result['n_rows']} 条评论数据")
+                dedup_ratio = 1 - result['unique_texts'] / result['n_rows'] if result['n_rows'] else 0.0
+                st.caption(f"🧹 去重：{result['n_rows']} 条评论中不重复文本 {result['unique_texts']} 条（重复率 {dedup_ratio:.0%}）"
+                           f" · ♻️ 本次新分析 {result['new_texts']} 条，其余复用已存结果")
 
                 if len(all_scores) == 0:
                     st.warning("⚠️ 未提取到任何有效标签评分")
                 else:
-                    all_scores = pd.Series(all_scores).sort_values(ascending=False)
-
-                    # 调整列的比例，使柱状图占据更多空间
-                    col1, _ = st.columns([3, 1])
-                    with col1:
-                        st.subheader("📊 各维度评分分布")
-                        fig1, ax1 = plt.subplots(figsize=(10, 6))
-                        colors = ['green' if v >= 4.78 else 'red' for v in all_scores.values]
-                        all_scores.plot(kind='bar', ax=ax1, color=colors, alpha=0.8)
-                        ax1.set_ylabel("评分（满分5.0）")
-                        ax1.set_ylim(4.5, 5.0)
-                        ax1.axhline(y=4.78, color='orange', linestyle='--', linewidth=1)
-                        ax1.text(0.02, 4.8, '优秀线 4.78', transform=ax1.transData, fontsize=10, color='orange')
-                        plt.xticks(rotation=45, ha='right')
-                        plt.tight_layout()
-                        st.pyplot(fig1)
-
-                    st.markdown("### 🔽 各维度评分详情")
-                    df_table = pd.DataFrame(list(all_scores.items()), columns=["维度", "评分"])
-                    st.table(df_table)
-
                     st.subheader("💡 优化建议（可修改）")
                     needs_improvement = all_scores[all_scores < 4.78]
                     if len(needs_improvement) == 0:
@@ -527,10 +497,32 @@ elif page == "📈 评论维度分析":
                             st.markdown(f"### 📌 {dim} ({score:.2f})")
                             st.text_area("建议：", value=default_suggestion, height=100, key=f"sug_{dim}")
 
-                    excel_data = to_excel(df)
-                    b64 = base64.b64encode(excel_data).decode()
-                    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="原始评论数据.xlsx">📥 下载原始数据</a>'
-                    st.markdown(href, unsafe_allow_html=True)
+                st.subheader("📅 维度趋势")
+                daily = result.get('daily')
+                if daily is None or daily.empty:
+                    st.caption("未找到可识别的评论日期列（如“点评日期”“入住日期”），无法按时间查看趋势。")
+                else:
+                    render_trends(daily, result['date_col'])
+
+                # 导出：点击下载时才生成文件（在后台线程中执行），页面本身不携带文件内容
+                st.subheader("📥 导出数据")
+                from export import EXPORT_FORMATS, export_analysis
+                export_format = st.radio("导出格式", list(EXPORT_FORMATS), horizontal=True,
+                                         help="CSV/Parquet 生成更快、体积更小；Excel 额外包含“维度评分”工作表")
+                extension, mime = EXPORT_FORMATS[export_format]
+                table = result['table']
+
+                def build_export():
+                    return export_analysis(BytesIO(uploaded_file.getvalue()), table, all_scores, export_format)
+
+                col_a, col_b = st.columns(2)
+                with col_a:
+                    st.download_button("📥 下载评论分析明细", build_export, file_name=f"评论分析明细.{extension}",
+                                       mime=mime, on_click="ignore")
+                with col_b:
+                    # 原始数据即上传的工作簿本身，无需整表载入后重新编码
+                    st.download_button("📥 下载原始数据", uploaded_file.getvalue, file_name="原始评论数据.xlsx",
+                                       mime=EXPORT_FORMATS["Excel"][1], on_click="ignore")
 
         except Exception as e:
             st.error(f"❌ 数据处理失败：{str(e)}")
@@ -538,22 +530,15 @@ elif page == "📈 评论维度分析":
 # ============ 4. 智能评论回复（同风格三条回复版） ============
 elif page == "💬 智能评论回复":
     st.title("💬 智能评论回复生成器（点击切换）")
+    from collections import defaultdict
+    from reply import (
+        VARIANT_SUFFIXES, generate_prompt, generate_reply_variants, generate_reply_variants_single_call,
+        generate_reply_variants_with_deadline, render_fallback_reply, stream_reply_variants, prompt_token_estimate
+    )
+    analysis_warmup()
+    bind_session_client()
 
-    # ✅ 统一从 secrets 或环境变量获取 API Key
-    try:
-        QWEN_API_KEY = st.secrets["QWEN_API_KEY"]
-    except KeyError:
-        QWEN_API_KEY = os.getenv("QWEN_API_KEY")
-
-    if not QWEN_API_KEY or not QWEN_API_KEY.startswith("sk-"):
-        st.warning("⚠️ 请设置有效的 Qwen API Key")
-        st.markdown("""
-        **设置方法：**
-        1. 在 Streamlit Cloud 的应用设置中打开 **Secrets**；
-        2. 添加：`QWEN_API_KEY = "sk-你的密钥"`；
-        3. 重新部署。
-        """)
-        st.stop()
+    QWEN_API_KEY = require_api_key()
 
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -562,49 +547,91 @@ elif page == "💬 智能评论回复":
         guest_name = st.text_input("客人姓名", "尊敬的宾客")
         review_source = st.selectbox("平台来源", ["携程", "美团", "飞猪", "去哪儿", "抖音"])
         style = st.selectbox("回复风格", ["标准", "正式", "亲切", "幽默","文艺"], index=0)
+        fresh = st.checkbox("🔄 生成全新回复", help="跳过回复缓存，重新调用模型生成不同的回复")
+        gen_mode = st.selectbox("生成方式", ["⚡ 流式输出", "📦 单次请求三条", "🔁 三次独立请求", "⏱️ 限时生成（超时兜底）"],
+                                help="流式：边生成边显示；单次请求：一次调用返回三条，节省一半以上输入 Token；三次独立请求：原有方式；"
+                                     "限时生成：慢请求自动补发对冲请求，到时仍未返回则使用本地模板回复")
+        if gen_mode == "⏱️ 限时生成（超时兜底）":
+            deadline = st.number_input("时限（秒）", min_value=3.0, max_value=60.0, value=15.0, step=1.0)
+            hedge_percentile = st.number_input("对冲分位（%）", min_value=50, max_value=99, value=90, step=1,
+                                               help="单条请求耗时超过历史该分位数时，补发一个相同请求，取先返回者")
 
     if st.button("✨ 生成三条回复", type="primary"):
         if not review_input.strip():
             st.warning("请输入评论内容！")
         else:
-            with st.spinner("AI 正在生成三条回复，请稍候..."):
-                replies = []
-                for i in range(3):
-                    # 构建提示词
-                    prompt = generate_prompt(
-                        review_input, guest_name,
-                        st.session_state.hotel_name,
-                        st.session_state.hotel_nickname,
-                        review_source,
-                        st.session_state.hotel_location,
-                        style=style
+            # 构建提示词（三条回复共用，仅多样性后缀不同）
+            prompt = generate_prompt(
+                review_input, guest_name,
+                st.session_state.hotel_name,
+                st.session_state.hotel_nickname,
+                review_source,
+                st.session_state.hotel_location,
+                style=style
+            )
+            if gen_mode == "⚡ 流式输出":
+                # 流式输出：三条回复并发生成，逐段刷新到各自的占位区域；首段到达前显示排队位置
+                waiting_text = "⏳ AI 正在生成三条回复，请稍候..."
+                status = st.empty()
+                status.caption(waiting_text)
+                slots = [st.empty() for _ in VARIANT_SUFFIXES]
+                partial = defaultdict(str)
+                finished = {}
+                for kind, number, data in stream_reply_variants(prompt, api_key=QWEN_API_KEY, use_cache=not fresh,
+                                                                idle_timeout=QUEUE_POLL_SECONDS):
+                    if kind == "idle":
+                        if not partial:
+                            show_queue_position(status, waiting_text)
+                        continue
+                    status.empty()
+                    if kind == "delta":
+                        partial[number] += data
+                        slots[number - 1].markdown(f"**第 {number} 条** ⏳ {partial[number]}▌")
+                    else:
+                        finished[number] = data
+                        slots[number - 1].markdown(f"**第 {number} 条** ✅（{data['word_count']} 字）{data['reply']}")
+                replies = [finished[n] for n in sorted(finished)]
+                for slot in slots:
+                    slot.empty()
+            elif gen_mode == "📦 单次请求三条":
+                with st.spinner("AI 正在生成三条回复，请稍候..."):
+                    replies = run_with_queue_feedback(generate_reply_variants_single_call, prompt,
+                                                      api_key=QWEN_API_KEY, use_cache=not fresh)
+            elif gen_mode == "⏱️ 限时生成（超时兜底）":
+                fallback_text = render_fallback_reply(
+                    review_input, guest_name,
+                    st.session_state.hotel_name,
+                    st.session_state.hotel_nickname,
+                    st.session_state.hotel_location
+                )
+                with st.spinner(f"AI 正在生成三条回复（最多 {deadline:.0f} 秒）..."):
+                    replies = run_with_queue_feedback(
+                        generate_reply_variants_with_deadline, prompt, api_key=QWEN_API_KEY, deadline=deadline,
+                        fallback_text=fallback_text, hedge_percentile=hedge_percentile, use_cache=not fresh
                     )
-                    # 添加多样性
-                    if i == 1:
-                        prompt += "\n\n请使用不同的句式和词汇表达相同的意思。"
-                    elif i == 2:
-                        prompt += "\n\n请换一种全新的表达方式，避免重复之前的措辞。"
-
-                    raw_reply = call_qwen_api(prompt, api_key=QWEN_API_KEY)
-                    # 使用增强版函数确保字数
-                    reply = truncate_to_word_count(raw_reply, min_words=200, max_words=250, prompt=prompt, api_key=QWEN_API_KEY)
-                    word_count = len([c for c in reply if c.isalnum() or c in '，。！？；：""''（）【】《》、'])
-
-                    replies.append({
-                        "reply": reply,
-                        "word_count": word_count,
-                        "number": i + 1
-                    })
-                    time.sleep(0.5)  # 避免调用过快
-
-                st.session_state.generated_replies = replies
-                st.session_state.current_reply_index = 0
+            else:
+                with st.spinner("AI 正在生成三条回复，请稍候..."):
+                    replies = run_with_queue_feedback(generate_reply_variants, prompt, api_key=QWEN_API_KEY,
+                                                      use_cache=not fresh)
+
+            st.session_state.generated_replies = replies
+            st.session_state.current_reply_index = 0
+            st.session_state.prompt_tokens = prompt_token_estimate(prompt)
+            fallbacks = [r for r in replies if r.get('fallback')]
+            failed = [r for r in replies if r['error'] and not r.get('fallback')]
+            if fallbacks:
+                st.warning(f"⚠️ {len(fallbacks)} 条回复未在时限内生成，已使用本地模板回复兜底，建议人工润色后再发布。")
+            elif failed:
+                st.warning(f"⚠️ {len(failed)} 条回复生成失败，其余 {len(replies) - len(failed)} 条可正常查看。")
+            else:
                 st.success("✅ 三条回复生成完成！点击下方切换查看。")
 
     # ✅ 展示当前选中的回复（如果有）
     if st.session_state.generated_replies:
         current = st.session_state.generated_replies[st.session_state.current_reply_index]
         st.markdown("### 当前回复")
+        if current.get('fallback'):
+            st.warning(f"⚠️ 兜底模板回复（模型未在时限内返回：{current['error']}）")
         st.markdown(f"""
         <div style="background-color: #f0f2f6; color: #000000; padding: 16px; border-radius: 8px; font-size: 15px; line-height: 1.7; border: 1px solid #ddd;">
         {current['reply']}
@@ -613,12 +640,15 @@ elif page == "💬 智能评论回复":
         🔤 字数：{current['word_count']} / 200–250 &nbsp;|&nbsp; 📌 第 {current['number']} 条
         </p>
         """, unsafe_allow_html=True)
+        tokens = st.session_state.get('prompt_tokens')
+        if tokens:
+            st.caption(f"📏 预估输入 Token：固定前缀 {tokens['system']} + 本条内容 {tokens['user']} = {tokens['total']} / 次请求")
 
         # 切换按钮
         col_a, col_b = st.columns([1, 1])
         with col_a:
             if st.button("🔄 切换到下一条回复"):
-                next_index = (st.session_state.current_reply_index + 1) % 3
+                next_index = (st.session_state.current_reply_index + 1) % len(st.session_state.generated_replies)
                 st.session_state.current_reply_index = next_index
                 st.rerun()
 
@@ -627,6 +657,148 @@ elif page == "💬 智能评论回复":
                 st.session_state.clipboard = current['reply']
                 st.success("已复制到剪贴板！")
 
+# ============ 5. 批量评论回复 ============
+elif page == "📦 批量评论回复":
+    st.title("📦 批量评论回复")
+    from batch_reply import (
+        GUEST_COLUMNS, PLATFORM_COLUMNS, checkpoint_path, load_checkpoint, replyable_rows, run_batch,
+        results_frame, to_excel_bytes
+    )
+    from ingest import find_column, find_comment_column, read_review_sheet
+    from qwen_client import LIMITER
+    analysis_warmup()
+    bind_session_client()
+    st.markdown("上传包含 **评论内容**（可选 **客人姓名**、**平台来源**）列的 Excel/CSV 文件，系统将逐条生成回复。任务中断后重新上传同一文件即可从断点继续。")
+
+    QWEN_API_KEY = require_api_key()
+
+    batch_file = st.file_uploader("上传评论表 (.xlsx / .csv)", type=["xlsx", "csv"])
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        batch_style = st.selectbox("回复风格", ["标准", "正式", "亲切", "幽默", "文艺"], index=0)
+    with col2:
+        batch_workers = st.number_input("并发请求数", 1, 16, 4, 1)
+    with col3:
+        batch_rate = st.number_input("每秒最多请求数", 0.1, 20.0, 2.0, 0.1)
+
+    if batch_file:
+        try:
+            batch_df = read_review_sheet(batch_file, batch_file.name)
+            review_col = find_comment_column([str(c) for c in batch_df.columns])
+            guest_col = find_column(batch_df.columns, GUEST_COLUMNS)
+            platform_col = find_column(batch_df.columns, PLATFORM_COLUMNS)
+
+            if not review_col:
+                st.error("❌ 未找到评论列，请确保包含“评论”或“评价”关键词的列。")
+            else:
+                st.caption(f"评论列：{review_col} · 姓名列：{guest_col or '（默认“尊敬的宾客”）'} · 平台列：{platform_col or '（默认携程）'}")
+                settings = {
+                    'hotel_name': st.session_state.hotel_name,
+                    'hotel_nickname': st.session_state.hotel_nickname,
+                    'hotel_location': st.session_state.hotel_location,
+                    'style': batch_style
+                }
+                checkpoint = checkpoint_path(batch_file.getvalue(), settings)
+                finished = len(load_checkpoint(checkpoint))
+                to_reply = len(replyable_rows(batch_df, review_col))
+                if finished >= to_reply > 0:
+                    st.info("✅ 该文件已全部生成完毕，点击“开始批量生成”可直接导出结果，不会重复调用模型。")
+                elif finished:
+                    st.info(f"⏯️ 检测到未完成的任务：已成功 {finished} / {to_reply} 条，将从断点继续。")
+
+                if st.button("🚀 开始批量生成", type="primary"):
+                    progress = st.progress(0.0, text="⏳ 正在生成...")
+
+                    def on_progress(done_count, total):
+                        position = LIMITER.queue_position()
+                        queued = f" · 🚦 共享限流排队中，前面还有 {position} 位用户" if position else ""
+                        progress.progress(done_count / total if total else 1.0,
+                                          text=f"⏳ 已完成 {done_count} / {total} 条{queued}")
+
+                    done = run_batch(batch_df, review_col, guest_col, platform_col, settings, QWEN_API_KEY,
+                                     checkpoint, max_workers=batch_workers, rate=batch_rate, on_progress=on_progress)
+                    st.session_state.batch_result = results_frame(batch_df, done)
+                    st.session_state.batch_excel = to_excel_bytes(st.session_state.batch_result)
+                    st.session_state.batch_checkpoint = checkpoint
+
+                if st.session_state.get('batch_checkpoint') == checkpoint:
+                    result_df = st.session_state.batch_result
+                    failed = int(result_df['状态'].str.startswith("失败").sum())
+                    if failed:
+                        st.warning(f"⚠️ {failed} 条生成失败，可再次点击“开始批量生成”仅重试失败的行。")
+                    else:
+                        st.success(f"✅ 批量生成完成，共 {int((result_df['状态'] == '成功').sum())} 条回复。")
+                    st.dataframe(result_df)
+                    st.download_button("📥 下载回复结果 (.xlsx)", st.session_state.batch_excel,
+                                       file_name="批量回复结果.xlsx",
+                                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        except Exception as e:
+            st.error(f"❌ 批量处理失败：{str(e)}")
+
+# ==================== 性能诊断 ====================
+def _on_perf_panel_change():
+    # 勾选即开始记录（进程级）；取消勾选只隐藏本会话的面板，不影响其他会话
+    if st.session_state.perf_panel:
+        metrics.set_enabled(True)
+
+st.sidebar.divider()
+if 'perf_panel' not in st.session_state:
+    st.session_state.perf_panel = metrics.enabled()
+perf_panel = st.sidebar.checkbox("🩺 性能诊断", key="perf_panel", on_change=_on_perf_panel_change,
+                                 help="勾选后显示诊断面板并开始记录各环节耗时与计数（进程级，所有会话共享）；"
+                                      "取消勾选只隐藏面板，停止记录请在面板内操作")
+if perf_panel:
+    snap = metrics.snapshot()
+    counters = snap['counters']
+    with st.sidebar.expander("📊 诊断数据", expanded=True):
+        if snap['spans']:
+            st.dataframe([
+                {'环节': name, '次数': s['count'], '总耗时(s)': round(s['total'], 3),
+                 'P50(ms)': round(s['p50'] * 1000, 1), 'P95(ms)': round(s['p95'] * 1000, 1)}
+                for name, s in sorted(snap['spans'].items())
+            ], hide_index=True)
+        analyze = snap['spans'].get('analyze_comments')
+        if analyze and analyze['total'] > 0:
+            st.caption(f"分析吞吐：{counters.get('analyze_rows', 0) / analyze['total']:,.0f} 行/秒")
+        requests_made = counters.get('qwen_requests', 0)
+        if requests_made:
+            st.caption(f"模型请求 {requests_made} 次 · 重试 {counters.get('qwen_retries', 0)} 次 · "
+                       f"失败 {counters.get('qwen_errors', 0)} 次 · 补写占比 "
+                       f"{counters.get('length_extension_calls', 0) / requests_made:.0%}")
+        for name, value in sorted(counters.items()):
+            st.caption(f"{name}: {value:,}")
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.download_button("JSONL", metrics.to_jsonl, file_name="metrics.jsonl",
+                               mime="application/jsonl", on_click="ignore")
+        with col_b:
+            st.download_button("Prometheus", metrics.to_prometheus, file_name="metrics.prom",
+                               mime="text/plain", on_click="ignore")
+        col_c, col_d = st.columns(2)
+        with col_c:
+            if st.button("清空诊断数据"):
+                metrics.reset()
+                st.rerun()
+        with col_d:
+            if metrics.enabled():
+                st.button("停止记录", help="对所有会话生效；关闭时几乎无额外开销",
+                          on_click=metrics.set_enabled, args=(False,))
+            else:
+                st.caption("记录已停止")
+                st.button("开始记录", on_click=metrics.set_enabled, args=(True,))
+
 # ==================== 尾部信息 ====================
 st.sidebar.divider()
+reply_cache = get_reply_cache()
+st.sidebar.caption(f"🗄️ 回复缓存：命中 {reply_cache.hits} · 未命中 {reply_cache.misses} · 已存 {reply_cache.size()} 条")
+if 'reply' in sys.modules:  # 只在回复模块已加载时显示，避免为此导入分析依赖
+    length = sys.modules['reply'].length_stats()
+    if length["total"]:
+        st.sidebar.caption(f"📏 字数调节：{length['total']} 条 · 本地补句 {length['padded']} · 模型补写 {length['extend_calls']} 次（{length['extend_rate']:.0%}）")
+if 'qwen_client' in sys.modules:
+    limiter = sys.modules['qwen_client'].LIMITER
+    st.sidebar.caption(f"🚦 共享限流：每秒 {limiter.rate:g} 次 · 当前排队 {limiter.waiting()} 个请求")
+timings = startup_timings()
+timings.setdefault('首次渲染', time.perf_counter() - _SCRIPT_START)
+st.sidebar.caption("⏱️ 冷启动：" + " · ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items()))
 st.sidebar.caption(f"@ 2025 {st.session_state.hotel_nickname} 酒店运营工具")
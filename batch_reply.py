@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+批量评论回复
+读取评论表（Excel/CSV），在令牌桶限流下并发生成回复；每完成一条即追加写入断点文件，
+任务中断后重新运行会跳过已成功的行，从断点继续。
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import pandas as pd
+
+from cache import content_hash
+from qwen_client import submit
+from reply import generate_prompt, generate_reply
+
+GUEST_COLUMNS = ['客人姓名', '姓名', '昵称', '用户名', 'guest']
+PLATFORM_COLUMNS = ['平台来源', '平台', '来源', '渠道', 'platform']
+DEFAULT_GUEST = "尊敬的宾客"
+DEFAULT_PLATFORM = "携程"
+CHECKPOINT_DIR = os.path.join(".cache", "batch")
+
+# ==================== 令牌桶限流 ====================
+class TokenBucket:
+    """令牌桶限流：平均每秒 rate 个请求，最多允许 capacity 个突发请求（线程安全）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# ==================== 断点文件 ====================
+def checkpoint_path(file_bytes, settings):
+    """断点文件路径：由文件内容与生成设置（酒店信息、风格）共同决定，设置变化即视为新任务"""
+    key = content_hash(file_bytes + json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return os.path.join(CHECKPOINT_DIR, f"{key[:32]}.jsonl")
+
+def load_checkpoint(path):
+    """读取断点文件中已成功的行：{行号: 记录}；失败的行会在续跑时重试"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 中断时可能留下不完整的末行
+            if not record.get('error'):
+                done[record['row']] = record
+    return done
+
+# ==================== 批量生成 ====================
+def replyable_rows(df, review_col):
+    """需要生成回复的行号（评论非空）"""
+    return [i for i, review in enumerate(df[review_col]) if not pd.isna(review) and str(review).strip()]
+
+def _process_row(row_id, review, guest_name, platform, settings, api_key, bucket):
+    """生成单行评论的回复，异常转为记录中的 error 字段"""
+    bucket.acquire()
+    try:
+        prompt = generate_prompt(review, guest_name, settings['hotel_name'], settings['hotel_nickname'],
+                                 platform, settings['hotel_location'], style=settings['style'])
+        result = generate_reply(prompt, api_key)
+        return {'row': row_id, 'reply': result['reply'], 'word_count': result['word_count'], 'error': None}
+    except Exception as e:
+        return {'row': row_id, 'reply': "", 'word_count': 0, 'error': str(e)}
+
+def run_batch(df, review_col, guest_col, platform_col, settings, api_key, checkpoint,
+              max_workers=4, rate=2.0, on_progress=None):
+    """
+    批量生成回复，返回 {行号: 记录}
+    settings：dict(hotel_name, hotel_nickname, hotel_location, style)
+    max_workers：并发请求数；rate：每秒最多发起的回复生成数
+    on_progress(已完成数, 总数)：每完成一行回调一次
+    """
+    done = load_checkpoint(checkpoint)
+    pending = [i for i in replyable_rows(df, review_col) if i not in done]
+    total = len(done) + len(pending)
+    if on_progress:
+        on_progress(len(done), total)
+
+    os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+    bucket = TokenBucket(rate)
+    with open(checkpoint, 'a', encoding='utf-8') as log, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for i in pending:
+            row = df.iloc[i]
+            guest = row[guest_col] if guest_col else None
+            platform = row[platform_col] if platform_col else None
+            futures.append(submit(
+                pool, _process_row, i, str(row[review_col]),
+                DEFAULT_GUEST if guest is None or pd.isna(guest) else str(guest),
+                DEFAULT_PLATFORM if platform is None or pd.isna(platform) else str(platform),
+                settings, api_key, bucket
+            ))
+        completed = len(done)
+        for future in as_completed(futures):
+            record = future.result()
+            log.write(json.dumps(record, ensure_ascii=False) + "\n")
+            log.flush()
+            done[record['row']] = record
+            completed += 1
+            if on_progress:
+                on_progress(completed, total)
+    return done
+
+def results_frame(df, done):
+    """在原表后追加回复内容、字数与状态列"""
+    out = df.copy()
+    records = [done.get(i) for i in range(len(df))]
+    out['回复内容'] = [r['reply'] if r else "" for r in records]
+    out['字数'] = [r['word_count'] if r else 0 for r in records]
+    out['状态'] = [
+        "未处理（空评论）" if r is None else (f"失败：{r['error']}" if r['error'] else "成功")
+        for r in records
+    ]
+    return out
+
+def to_excel_bytes(df, sheet_name='批量回复'):
+    """导出为 Excel 字节"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
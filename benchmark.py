@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准
+用固定随机种子按词库生成合成酒店评论，测量分析流程的吞吐与峰值内存、
+单条评论各环节（维度情感提取、提示词构建、字数调节）的耗时，
+以及在本地模拟 DashScope 服务（可设延迟与错误率）下的回复端到端时延。
+全程离线运行，结果写为 JSON，便于不同版本之间对比。
+
+用法：
+    python benchmark.py                               # 1k/100k/1M 全部规模
+    python benchmark.py --sizes 1000,100000 --output bench.json
+    python benchmark.py --compare old.json --output new.json
+    python benchmark.py --skip pipeline > bench.json  # 进度写到标准错误，标准输出只有 JSON
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，峰值内存记为 None
+    resource = None
+
+from lexicon import LEXICON_VERSION, NEGATIVE_WORDS, POSITIVE_WORDS, TAG_KEYWORDS
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_SEED = 20240501
+# 回复基准测的是客户端开销：把进程级限流放宽到不起作用（可用同名环境变量覆盖，以测限流本身）
+BENCH_RATE_LIMIT = "100000"
+
+def log(message):
+    """进度与对比信息写到标准错误，标准输出只留给 JSON 结果（可直接重定向到文件）"""
+    print(message, file=sys.stderr, flush=True)
+
+# ==================== 合成评论 ====================
+PLACEHOLDERS = ["此用户未填写评价内容", "默认好评", "好评！"]
+CONNECTORS = ["很", "非常", "比较", "挺", "有点", "特别", ""]
+FILLERS = ["这次出差入住", "带家人来玩", "第二次住了", "前台小姐姐", "整体来说", "总的来说", "下次还会来"]
+
+def synthetic_reviews(n, seed=DEFAULT_SEED, placeholder_rate=0.15, duplicate_rate=0.2):
+    """
+    生成 n 条合成评论：每条由 1–4 个“维度关键词 + 程度词 + 情感词”短句拼成，
+    按比例混入系统默认评价与复制粘贴的重复评论；相同 seed 结果完全一致
+    """
+    rng = random.Random(seed)
+    keywords = [w for words in TAG_KEYWORDS.values() for w in words]
+    positive = sorted(POSITIVE_WORDS)
+    negative = sorted(NEGATIVE_WORDS)
+    reviews = []
+    for _ in range(n):
+        r = rng.random()
+        if r < placeholder_rate:
+            reviews.append(rng.choice(PLACEHOLDERS))
+            continue
+        if r < placeholder_rate + duplicate_rate and reviews:
+            reviews.append(reviews[rng.randrange(len(reviews))])
+            continue
+        clauses = []
+        for _ in range(rng.randint(1, 4)):
+            sentiment = rng.choice(positive) if rng.random() < 0.7 else rng.choice(negative)
+            clauses.append(rng.choice(keywords) + rng.choice(CONNECTORS) + sentiment)
+        if rng.random() < 0.5:
+            clauses.insert(0, rng.choice(FILLERS))
+        reviews.append("，".join(clauses) + "。")
+    return reviews
+
+# ==================== 模拟 DashScope 服务 ====================
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        time.sleep(server.delay)
+        with server.lock:
+            failed = server.rng.random() < server.error_rate
+        if failed:
+            body = b'{"code": "Throttling", "message": "mock error"}'
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        text = server.reply_text
+        if self.headers.get('X-DashScope-SSE') == 'enable':
+            parts = [text[i:i + 20] for i in range(0, len(text), 20)]
+            body = "".join(
+                f"id:{i}\nevent:result\ndata:{json.dumps({'output': {'text': part}}, ensure_ascii=False)}\n\n"
+                for i, part in enumerate(parts)
+            ).encode('utf-8')
+            content_type = 'text/event-stream'
+        else:
+            body = json.dumps({'output': {'text': text}}, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_mock_server(delay=0.2, error_rate=0.0, seed=DEFAULT_SEED):
+    """在本地随机端口启动模拟生成服务，返回 (server, url)；server.shutdown() 停止"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _MockHandler)
+    server.delay = delay
+    server.error_rate = error_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.reply_text = (
+        "【❤️服务周到❤️】亲爱的客人，您好！感谢您选择入住并留下宝贵的评价。"
+        "很高兴您认可我们的服务与早餐，这是对我们团队最大的鼓励。"
+        "酒店位于市中心，步行即可到达地铁站，周边餐饮购物都很方便。"
+        "我们始终致力于为每一位客人提供干净舒适的入住环境和贴心周到的服务，"
+        "也会继续倾听客人的声音，在细节上不断改进，让每一次入住都更加愉快。"
+        "期待您再次光临，祝您生活愉快！"
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/generation"
+
+# ==================== 测量工具 ====================
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024, 1)
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+def _time_calls(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+# ==================== 基准项 ====================
+def _pipeline_worker(size, seed, workers, queue):
+    """子进程内运行：隔离每个规模的峰值内存"""
+    import pandas as pd
+    from analysis import extract_tags_with_scores, warm_up
+    warm_up()
+    baseline = peak_rss_mb()
+    comments = pd.Series(synthetic_reviews(size, seed))
+    start = time.perf_counter()
+    scores = extract_tags_with_scores(comments, workers=workers)
+    seconds = time.perf_counter() - start
+    queue.put({
+        'name': 'extract_tags_with_scores',
+        'rows': size,
+        'unique_texts': int(comments.nunique()),
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(size / seconds, 1),
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': baseline,
+        'dimensions': len(scores),
+    })
+
+def bench_pipeline(sizes, seed, workers):
+    """各规模下的整列分析吞吐与峰值内存（每个规模一个独立子进程）"""
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for size in sizes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_pipeline_worker, args=(size, seed, workers, queue))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        results.append(result)
+        log(f"  分析 {size:>9,} 行：{result['seconds']:.2f}s，{result['rows_per_sec']:,.0f} 行/秒，"
+              f"峰值内存 {result['peak_rss_mb']} MB")
+    return results
+
+def bench_functions(seed, samples=2000):
+    """单条评论的各环节耗时：维度情感提取、提示词构建、字数调节（本地路径，不调用模型）"""
+    from analysis import extract_aspects_and_sentiment, warm_up
+    from reply import generate_prompt, truncate_to_word_count
+    warm_up()
+    reviews = synthetic_reviews(samples, seed + 1, placeholder_rate=0, duplicate_rate=0)
+    rng = random.Random(seed)
+    sentence = "感谢您的入住与评价，我们会继续努力。"
+    drafts = [sentence * rng.randint(8, 18) for _ in range(samples)]
+
+    results = []
+    for name, func, args_list in [
+        ('extract_aspects_and_sentiment', extract_aspects_and_sentiment, [(r,) for r in reviews]),
+        ('generate_prompt', generate_prompt,
+         [(r, "尊敬的宾客", "示例酒店", "小客服", "携程", "市中心") for r in reviews]),
+        ('truncate_to_word_count', truncate_to_word_count, [(d,) for d in drafts]),
+    ]:
+        result = {'name': name, **_summary(_time_calls(func, args_list))}
+        results.append(result)
+        log(f"  {name}：均值 {result['mean_ms']} ms，P95 {result['p95_ms']} ms")
+    return results
+
+def bench_replies(seed, requests_count, delay, error_rate):
+    """模拟服务下的回复端到端时延：单条非流式、流式首字与三条并发"""
+    import qwen_client
+    from qwen_client import QwenAPIError
+    from reply import generate_prompt, generate_reply, generate_reply_variants, stream_qwen_api
+
+    prompts = [generate_prompt(r, "尊敬的宾客", "示例酒店", "小客服", "携程", "市中心")
+               for r in synthetic_reviews(requests_count, seed + 2, placeholder_rate=0, duplicate_rate=0)]
+    server, url = start_mock_server(delay=delay, error_rate=error_rate, seed=seed)
+    qwen_client.API_URL = url   # 只请求本地模拟服务
+    results = []
+    try:
+        single, errors = [], 0
+        for prompt in prompts:
+            start = time.perf_counter()
+            try:
+                generate_reply(prompt, "sk-benchmark", use_cache=False)
+            except QwenAPIError:
+                errors += 1
+            single.append(time.perf_counter() - start)
+        results.append({'name': 'generate_reply', 'errors': errors, **_summary(single)})
+
+        first_token, errors = [], 0
+        for prompt in prompts:
+            start = time.perf_counter()
+            try:
+                next(iter(stream_qwen_api(prompt, "sk-benchmark", use_cache=False)))
+            except QwenAPIError:
+                errors += 1
+            first_token.append(time.perf_counter() - start)
+        results.append({'name': 'stream_first_token', 'errors': errors, **_summary(first_token)})
+
+        variants = _time_calls(lambda p: generate_reply_variants(p, "sk-benchmark", use_cache=False),
+                               [(p,) for p in prompts[:max(1, requests_count // 3)]])
+        results.append({'name': 'generate_reply_variants', **_summary(variants)})
+    finally:
+        server.shutdown()
+    for result in results:
+        log(f"  {result['name']}：均值 {result['mean_ms']} ms，P95 {result['p95_ms']} ms"
+              + (f"，失败 {result['errors']}" if 'errors' in result else ""))
+    return results
+
+# ==================== 结果输出与对比 ====================
+def environment(seed):
+    """运行环境与版本信息，写入结果文件以便对比"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'lexicon_version': LEXICON_VERSION,
+        'qwen_rate_limit': float(os.environ['QWEN_RATE_LIMIT']) if 'QWEN_RATE_LIMIT' in os.environ else None,
+        'qwen_rate_burst': float(os.environ['QWEN_RATE_BURST']) if 'QWEN_RATE_BURST' in os.environ else None,
+    }
+
+def compare(old, new):
+    """按（名称, 规模）对齐两份结果，打印耗时变化（正数表示变慢）"""
+    def index(report):
+        return {(r['name'], r.get('rows')): r for section in report['results'].values() for r in section}
+    before = index(old)
+    for key, result in index(new).items():
+        if key not in before:
+            continue
+        field = 'seconds' if 'seconds' in result else 'mean_ms'
+        if before[key][field]:
+            change = result[field] / before[key][field] - 1
+            label = key[0] + (f"[{key[1]:,}]" if key[1] else "")
+            log(f"  {label}：{before[key][field]} → {result[field]}（{change:+.1%}）")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="酒店评论分析与回复生成的性能基准")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="分析规模，逗号分隔")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--workers", type=int, default=1, help="分析进程数（默认 1，便于结果可比）")
+    parser.add_argument("--samples", type=int, default=2000, help="单条函数基准的调用次数")
+    parser.add_argument("--requests", type=int, default=30, help="回复时延基准的请求数")
+    parser.add_argument("--mock-delay", type=float, default=0.2, help="模拟服务每次响应的延迟（秒）")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="模拟服务返回 503 的概率")
+    parser.add_argument("--skip", default="", help="跳过的部分：pipeline,functions,replies")
+    parser.add_argument("--output", help="结果 JSON 文件路径（默认输出到标准输出）")
+    parser.add_argument("--compare", help="与之前的结果文件对比")
+    args = parser.parse_args(argv)
+    # 回复缓存写到临时目录，不影响应用自身的缓存（须在导入 reply_cache 之前设置）
+    os.environ['REPLY_CACHE_PATH'] = os.path.join(tempfile.mkdtemp(), "reply_cache.sqlite3")
+    # 同理须在导入 qwen_client 之前设置：限流器在导入时按环境变量创建
+    os.environ.setdefault('QWEN_RATE_LIMIT', BENCH_RATE_LIMIT)
+    os.environ.setdefault('QWEN_RATE_BURST', BENCH_RATE_LIMIT)
+
+    skip = set(filter(None, args.skip.split(",")))
+    report = {'environment': environment(args.seed), 'results': {}}
+    if 'pipeline' not in skip:
+        log("▶ 分析流程")
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+        report['results']['pipeline'] = bench_pipeline(sizes, args.seed, args.workers)
+    if 'functions' not in skip:
+        log("▶ 单条函数")
+        report['results']['functions'] = bench_functions(args.seed, args.samples)
+    if 'replies' not in skip:
+        log(f"▶ 回复时延（模拟延迟 {args.mock_delay}s，错误率 {args.mock_error_rate:.0%}）")
+        report['results']['replies'] = bench_replies(args.seed, args.requests, args.mock_delay, args.mock_error_rate)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        log("▶ 与基线对比")
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
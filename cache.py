@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+通用缓存工具
+线程安全的定长 LRU 缓存，可在多个 Streamlit 会话之间共享；
+以及合并相同键并发调用的 SingleFlight。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """按条目数限制容量的 LRU 缓存，超出容量时淘汰最久未使用的条目"""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class SingleFlight:
+    """相同键的并发调用只执行一次：首个调用者执行 fn，其余调用者等待并共享其结果（或异常）"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """返回 (结果, 是否共享了他人的调用)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self):
+        """正在执行的调用数"""
+        with self._lock:
+            return len(self._calls)
+
+def content_hash(data):
+    """计算字节内容的 SHA-256 摘要"""
+    return hashlib.sha256(data).hexdigest()
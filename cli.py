@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+命令行入口（不导入 Streamlit）
+  python cli.py analyze 评论导出目录 [--jobs 4] [--export CSV]
+      并行分析目录下的全部 .xlsx，结果保存到 pipeline.RESULTS_DIR；网页上传同一文件时直接载入
+  python cli.py reply 评论导出目录 --hotel-name 酒店名称 [--style 标准]
+      逐个文件批量生成回复（需环境变量 QWEN_API_KEY），断点与网页“批量评论回复”共用
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from cache import content_hash
+
+REPLY_STYLES = ["标准", "正式", "亲切", "幽默", "文艺"]
+OUTPUT_SUFFIXES = ("_分析结果", "_回复")  # 本工具写出的结果文件，再次运行时跳过
+
+def list_files(directory, suffixes):
+    """目录下指定扩展名的文件（按文件名排序，跳过 Excel 临时文件与本工具写出的结果文件）"""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(suffixes) and not name.startswith("~$")
+        and not os.path.splitext(name)[0].endswith(OUTPUT_SUFFIXES)
+    )
+
+# ==================== 评论维度分析 ====================
+def analyze_file(path, workers=1, export_fmt=None, out_dir=None):
+    """分析单个工作簿并保存结果，返回摘要 dict；已有结果时直接跳过（在子进程中运行）"""
+    from pipeline import analyze_workbook, load_result, save_result
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = content_hash(data)
+    start = time.perf_counter()
+    result = load_result(digest)
+    cached = result is not None
+    if not cached:
+        result = analyze_workbook(BytesIO(data), workers=workers)
+        if result['comment_col']:
+            save_result(digest, result)
+    summary = {'file': path, 'digest': digest[:32], 'comment_col': result['comment_col'], 'rows': result['n_rows'],
+               'unique': result['unique_texts'], 'new': result['new_texts'], 'cached': cached,
+               'seconds': round(time.perf_counter() - start, 3)}
+
+    if export_fmt and result['comment_col']:
+        from export import EXPORT_FORMATS, write_analysis
+        ext = EXPORT_FORMATS[export_fmt][0]
+        target = os.path.join(out_dir or os.path.dirname(path),
+                              f"{os.path.splitext(os.path.basename(path))[0]}_分析结果.{ext}")
+        with open(target, 'wb') as f:
+            write_analysis(BytesIO(data), result['table'], result['scores'], export_fmt, f)
+        summary['export'] = target
+    return summary
+
+def run_analyze(args):
+    files = list_files(args.directory, (".xlsx",))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    failed = 0
+    # 每个文件一个任务；spawn 启动的子进程只导入分析相关模块
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=ctx) as pool:
+        futures = {pool.submit(analyze_file, path, args.workers, args.export, args.out): path for path in files}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {'file': futures[future], 'error': str(e)}
+            if summary.get('error') or not summary.get('comment_col'):
+                failed += 1
+            print(json.dumps(summary, ensure_ascii=False), flush=True)
+    return 1 if failed else 0
+
+# ==================== 批量评论回复 ====================
+def run_reply(args):
+    from batch_reply import (
+        GUEST_COLUMNS, PLATFORM_COLUMNS, checkpoint_path, results_frame, run_batch, to_excel_bytes
+    )
+    from ingest import find_column, find_comment_column, read_review_sheet
+
+    api_key = os.getenv("QWEN_API_KEY")
+    if not api_key:
+        print("未设置环境变量 QWEN_API_KEY", file=sys.stderr)
+        return 2
+    settings = {
+        'hotel_name': args.hotel_name,
+        'hotel_nickname': args.nickname,
+        'hotel_location': args.location,
+        'style': args.style
+    }
+    out_dir = args.out or args.directory
+    os.makedirs(out_dir, exist_ok=True)
+    failed = 0
+    for path in list_files(args.directory, (".xlsx", ".csv")):
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            data = f.read()
+        df = read_review_sheet(BytesIO(data), path)
+        review_col = find_comment_column([str(c) for c in df.columns])
+        if not review_col:
+            print(json.dumps({'file': path, 'error': "未找到评论列"}, ensure_ascii=False), flush=True)
+            failed += 1
+            continue
+        # 断点路径与网页一致：同一文件、同一设置在网页上上传时直接显示为已完成
+        done = run_batch(df, review_col, find_column(df.columns, GUEST_COLUMNS),
+                         find_column(df.columns, PLATFORM_COLUMNS), settings, api_key,
+                         checkpoint_path(data, settings), max_workers=args.workers, rate=args.rate)
+        result = results_frame(df, done)
+        target = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(path))[0]}_回复.xlsx")
+        with open(target, 'wb') as f:
+            f.write(to_excel_bytes(result))
+        errors = int(result['状态'].str.startswith("失败").sum())
+        failed += errors > 0
+        print(json.dumps({'file': path, 'output': target, 'replied': int((result['状态'] == "成功").sum()),
+                          'failed': errors, 'seconds': round(time.perf_counter() - start, 3)},
+                         ensure_ascii=False), flush=True)
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="酒店评论分析与批量回复（命令行，不启动网页）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze", help="并行分析目录下的评论导出（.xlsx），结果供网页直接载入")
+    analyze.add_argument("directory")
+    analyze.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="同时分析的文件数（进程数）")
+    analyze.add_argument("--workers", type=int, default=1, help="单个文件内的分析进程数")
+    analyze.add_argument("--export", choices=["CSV", "Parquet", "Excel"], help="同时导出评论明细")
+    analyze.add_argument("--out", help="导出文件目录（默认与源文件相同）")
+
+    reply = sub.add_parser("reply", help="批量生成目录下评论表（.xlsx/.csv）的回复")
+    reply.add_argument("directory")
+    reply.add_argument("--hotel-name", default="中油花园酒店")
+    reply.add_argument("--nickname", default="小油", help="客服昵称")
+    reply.add_argument("--location", default="该城市某处", help="酒店位置")
+    reply.add_argument("--style", choices=REPLY_STYLES, default="标准")
+    reply.add_argument("--workers", type=int, default=4, help="并发请求数")
+    reply.add_argument("--rate", type=float, default=2.0, help="每秒最多请求数")
+    reply.add_argument("--out", help="结果文件目录（默认与源文件相同）")
+
+    args = parser.parse_args(argv)
+    return run_analyze(args) if args.command == "analyze" else run_reply(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
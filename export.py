@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+分析结果导出
+用户点击下载时才重新读取上传的工作簿，拼接每条评论的维度/情感分析结果，按所选格式（CSV / Parquet / Excel）编码为字节。
+维度评分表只包含在 Excel 导出中（第二个工作表），CSV 与 Parquet 只含评论明细。
+CSV 与 Parquet 逐块读取、逐块写出，内存占用与文件大小无关；Excel 写入器需要整表，仍一次性生成。
+"""
+
+from io import BytesIO
+
+import pandas as pd
+
+from analysis import annotate_comments
+from ingest import iter_excel_chunks
+
+# 格式名：(扩展名, MIME 类型)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+def iter_detail_chunks(file, table):
+    """逐块产出原始评论行 + 该块评论的分析列；分块读取的行索引与分析结果表一致"""
+    for chunk in iter_excel_chunks(file):
+        yield chunk.join(annotate_comments(table.loc[chunk.index[0]:chunk.index[-1]]))
+
+def comment_detail_frame(file, table):
+    """完整的评论明细表（整表载入内存，仅供 Excel 导出使用）"""
+    return pd.concat(list(iter_detail_chunks(file, table)))
+
+def scores_frame(scores):
+    """维度评分表：维度、评分、命中优秀线"""
+    return pd.DataFrame({'维度': scores.index, '评分': scores.values, '达到优秀线': scores.values >= 4.78})
+
+def _write_csv(chunks, out):
+    out.write('\ufeff'.encode('utf-8'))   # BOM：Excel 可直接打开中文
+    for i, chunk in enumerate(chunks):
+        out.write(chunk.to_csv(index=False, header=i == 0).encode('utf-8'))
+
+# infer_dtype 结果 → Parquet 列类型；未列出的（文本、混合类型等）一律按字符串写出
+_INTEGER_KINDS = {'integer'}
+_NUMERIC_KINDS = {'integer', 'floating', 'mixed-integer-float', 'decimal'}
+_DATETIME_KINDS = {'datetime', 'datetime64', 'date'}
+
+def _parquet_schema(chunks):
+    """
+    首遍扫描全部块，按各列在整个文件中出现过的值类型确定统一的列类型：
+    全为整数 → int64；整数与小数 → float64；布尔 → bool；日期时间 → timestamp；其余（含数字与文本混合）→ string
+    """
+    import pyarrow as pa
+
+    kinds = {}
+    for chunk in chunks:
+        for col in chunk.columns:
+            kinds.setdefault(col, set()).add(pd.api.types.infer_dtype(chunk[col], skipna=True))
+    fields = []
+    for col, found in kinds.items():
+        found = found - {'empty'}
+        if found and found <= _INTEGER_KINDS:
+            dtype = pa.int64()
+        elif found and found <= _NUMERIC_KINDS:
+            dtype = pa.float64()
+        elif found == {'boolean'}:
+            dtype = pa.bool_()
+        elif found and found <= _DATETIME_KINDS:
+            dtype = pa.timestamp('us')
+        else:
+            dtype = pa.string()
+        fields.append(pa.field(col, dtype))
+    return pa.schema(fields)
+
+def _conform(chunk, schema):
+    """按统一的列类型转换一块数据：字符串列逐值转为文本（空值保留），数值列转为 float64"""
+    import pyarrow as pa
+
+    chunk = chunk.copy()
+    for field in schema:
+        if pa.types.is_string(field.type):
+            chunk[field.name] = chunk[field.name].map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+        elif pa.types.is_floating(field.type):
+            chunk[field.name] = pd.to_numeric(chunk[field.name]).astype('float64')
+    return chunk
+
+def _write_parquet(make_chunks, out):
+    """make_chunks() 每次调用返回新的块迭代器：首遍确定列类型，第二遍逐块写出（各块类型不一致也能写入同一文件）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(make_chunks())
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in make_chunks():
+            writer.write_table(pa.Table.from_pandas(_conform(chunk, schema), schema=schema, preserve_index=False))
+
+def write_analysis(file, table, scores, fmt, out):
+    """
+    将评论明细写入二进制输出 out：CSV/Parquet 只含明细，逐块写出；
+    Excel 额外包含“维度评分”工作表，需整表载入后一次性写出
+    """
+    if fmt == "CSV":
+        _write_csv(iter_detail_chunks(file, table), out)
+    elif fmt == "Parquet":
+        def make_chunks():
+            file.seek(0)
+            return iter_detail_chunks(file, table)
+        _write_parquet(make_chunks, out)
+    else:
+        with pd.ExcelWriter(out, engine='openpyxl') as writer:
+            comment_detail_frame(file, table).to_excel(writer, index=False, sheet_name='评论明细')
+            scores_frame(scores).to_excel(writer, index=False, sheet_name='维度评分')
+
+def export_analysis(file, table, scores, fmt):
+    """导出评论明细，返回文件字节（格式说明见 write_analysis）"""
+    output = BytesIO()
+    write_analysis(file, table, scores, fmt, output)
+    return output.getvalue()
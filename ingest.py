@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+评论数据读取
+基于 openpyxl 只读模式逐行迭代工作表，按固定行数分块产出 DataFrame，
+大文件无需一次性载入内存。
+"""
+
+import time
+
+import openpyxl
+import pandas as pd
+
+import metrics
+
+STREAM_CHUNK_ROWS = 20000  # 每块行数，与并行分析阈值一致，保证大文件的每块都能走进程池
+
+def find_comment_column(columns):
+    """定位评论列：优先“评论内容”，其次任一包含“评论/评价/content”的列（跳过“评论日期”等日期列）"""
+    if '评论内容' in columns:
+        return '评论内容'
+    potential = [col for col in columns if ('评论' in col or '评价' in col or 'content' in col)
+                 and '日期' not in col and '时间' not in col]
+    return potential[0] if potential else None
+
+def read_review_sheet(file, filename):
+    """读取评论表：.csv 按 UTF-8（兼容 GBK）解析，其余按 Excel 解析"""
+    if filename.lower().endswith('.csv'):
+        try:
+            return pd.read_csv(file, encoding='utf-8-sig')
+        except UnicodeDecodeError:
+            file.seek(0)
+            return pd.read_csv(file, encoding='gbk')
+    return pd.read_excel(file)
+
+def find_column(columns, candidates):
+    """返回第一个列名包含任一候选关键词的列，找不到时返回 None"""
+    for candidate in candidates:
+        for col in columns:
+            if candidate in str(col):
+                return col
+    return None
+
+def excel_row_count(file):
+    """读取工作表记录的数据行数（不含表头），文件未记录尺寸时返回 None"""
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        max_row = wb.active.max_row
+    finally:
+        wb.close()
+        file.seek(0)
+    return max_row - 1 if max_row else None
+
+def iter_excel_chunks(file, chunk_size=STREAM_CHUNK_ROWS):
+    """
+    逐块读取 Excel 首个工作表，首行作为表头
+    每块为一个 DataFrame，行索引在各块之间连续；整行为空的行会被跳过
+    每块的读取耗时（不含调用方处理该块的时间）记入埋点 excel_read
+    """
+    read_start = time.perf_counter()
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        width = len(columns)
+
+        start = 0
+        buffer = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            if len(row) != width:
+                row = tuple(row[:width]) + (None,) * (width - len(row))
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                chunk = pd.DataFrame(buffer, columns=columns, index=range(start, start + len(buffer)))
+                metrics.observe("excel_read", time.perf_counter() - read_start)
+                metrics.incr("excel_rows", len(buffer))
+                yield chunk
+                read_start = time.perf_counter()
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            chunk = pd.DataFrame(buffer, columns=columns, index=range(start, start + len(buffer)))
+            metrics.observe("excel_read", time.perf_counter() - read_start)
+            metrics.incr("excel_rows", len(buffer))
+            yield chunk
+    finally:
+        wb.close()
+        file.seek(0)
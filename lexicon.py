@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+词库与多模式匹配引擎
+将维度关键词、正负面情感词、设施/噪音词统一编译为一个 Aho-Corasick 自动机，
+每条评论只扫描一遍即可得到维度命中、情感词计数与各类标记。
+"""
+
+import hashlib
+from collections import deque
+from typing import NamedTuple
+
+# ==================== 词库 ====================
+TAG_KEYWORDS = {
+    '位置': ['位置', '地段', '周边', '附近', '离', '靠近', '市中心', '地铁', '公交'],
+    '交通': ['交通', '打车', '停车', '驾车', '机场', '车站', '接驳'],
+    '早餐': ['早餐', '早饭', '餐饮', 'buffet', '餐食', '自助餐'],
+    '安静': ['安静', '噪音', '吵', '吵闹', '隔音', '清静', '安静房'],
+    '床舒适': ['床', '床垫', '睡感', '舒服', '舒不舒服', '软硬', '枕头'],
+    '房间大小': ['房间小', '房间大', '空间', '拥挤', '宽敞', '面积', '局促'],
+    '视野': ['视野', '景观', '江景', '海景', '窗景', '朝向', '夜景', 'view'],
+    '性价比': ['性价比', '价格', '划算', '贵', '便宜', '值', '物超所值'],
+    '网络': ['Wi-Fi', '网络', '信号', '上网', '网速', 'wifi', '无线']
+}
+
+POSITIVE_WORDS = {'好', '棒', '赞', '满意', '不错', '推荐', '惊喜', '舒服', '完美', '贴心',
+                  '干净', '方便', '快捷', '温馨', '柔软', '丰富', '齐全', '优质', '热情'}
+NEGATIVE_WORDS = {'差', '糟', '烂', '坑', '差劲', '失望', '糟糕', '难用', '吵', '脏',
+                  '贵', '偏', '慢', '不值', '问题', '敷衍', '拖延', '恶劣'}
+
+FACILITY_ISSUE_WORDS = ['旧', '坏', '损坏', '故障', '设施陈旧', '设备老化']
+NOISE_WORDS = ['吵', '噪音', '隔音', '安静']
+
+ASPECTS = list(TAG_KEYWORDS)
+
+# 词库指纹：词库内容变化时自动改变，用作分析结果缓存键的一部分
+LEXICON_VERSION = hashlib.sha256(repr((
+    TAG_KEYWORDS, sorted(POSITIVE_WORDS), sorted(NEGATIVE_WORDS), FACILITY_ISSUE_WORDS, NOISE_WORDS
+)).encode('utf-8')).hexdigest()[:12]
+
+
+# ==================== 匹配结果 ====================
+class LexiconHits(NamedTuple):
+    """单条评论的扫描结果"""
+    aspect_mask: int          # 第 i 位对应 ASPECTS[i]
+    pos_count: int            # 命中的不同正面词个数
+    neg_count: int            # 命中的不同负面词个数
+    has_facility_issue: bool
+    has_noise: bool
+
+    @property
+    def aspects(self):
+        """按 TAG_KEYWORDS 顺序返回命中的维度名称"""
+        return [a for i, a in enumerate(ASPECTS) if self.aspect_mask >> i & 1]
+
+
+# ==================== Aho-Corasick 自动机 ====================
+class LexiconMatcher:
+    """
+    多词库 Aho-Corasick 自动机（大小写不敏感）
+    每个词分配一个比特位，扫描时把经过的所有输出状态按位或起来，
+    最后用各词库的掩码求交即可得到命中情况，重叠匹配（如“差”与“差劲”）均会被计入。
+    """
+
+    def __init__(self, tag_keywords, positive_words, negative_words, facility_words, noise_words):
+        self._word_bits = {}
+        self._aspect_masks = [self._mask(kws) for kws in tag_keywords.values()]
+        self._pos_mask = self._mask(positive_words)
+        self._neg_mask = self._mask(negative_words)
+        self._facility_mask = self._mask(facility_words)
+        self._noise_mask = self._mask(noise_words)
+        self._build()
+
+    def _mask(self, words):
+        mask = 0
+        for w in words:
+            w = w.lower()
+            if w not in self._word_bits:
+                self._word_bits[w] = 1 << len(self._word_bits)
+            mask |= self._word_bits[w]
+        return mask
+
+    def _build(self):
+        # 1. 构建 Trie
+        goto = [{}]
+        output = [0]
+        for word, bit in self._word_bits.items():
+            state = 0
+            for ch in word:
+                if ch not in goto[state]:
+                    goto.append({})
+                    output.append(0)
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            output[state] |= bit
+
+        # 2. BFS 计算失败指针，并直接展开为完整的状态转移表（DFA），扫描时无需回溯
+        fail = [0] * len(goto)
+        delta = [dict(g) for g in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            output[state] |= output[fail[state]]
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                queue.append(nxt)
+            if state:
+                for ch, nxt in delta[fail[state]].items():
+                    delta[state].setdefault(ch, nxt)
+
+        self._delta = delta
+        self._output = output
+
+    def match_bits(self, text):
+        """扫描一遍文本，返回命中词的比特集合"""
+        delta = self._delta
+        output = self._output
+        state = 0
+        hit = 0
+        for ch in str(text).lower():
+            state = delta[state].get(ch, 0)
+            if output[state]:
+                hit |= output[state]
+        return hit
+
+    def scan(self, text):
+        """扫描一遍文本，同时返回维度命中、情感词计数与设施/噪音标记"""
+        hit = self.match_bits(text)
+        aspect_mask = 0
+        if hit:
+            for i, mask in enumerate(self._aspect_masks):
+                if hit & mask:
+                    aspect_mask |= 1 << i
+        return LexiconHits(
+            aspect_mask=aspect_mask,
+            pos_count=(hit & self._pos_mask).bit_count(),
+            neg_count=(hit & self._neg_mask).bit_count(),
+            has_facility_issue=bool(hit & self._facility_mask),
+            has_noise=bool(hit & self._noise_mask)
+        )
+
+
+LEXICON = LexiconMatcher(TAG_KEYWORDS, POSITIVE_WORDS, NEGATIVE_WORDS, FACILITY_ISSUE_WORDS, NOISE_WORDS)
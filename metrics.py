@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+性能埋点
+进程内的计时区间（span）、计数器与耗时直方图，可导出为 JSON Lines 或 Prometheus 文本格式。
+默认关闭：关闭时 span/observe/incr 只做一次布尔判断即返回，不影响热点路径。
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# 直方图分桶上界（秒），与 Prometheus 默认分桶相近
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+EVENT_LOG_SIZE = 5000     # JSON Lines 导出保留的最近事件数
+SAMPLE_SIZE = 500         # 每个直方图保留的最近样本数，用于计算分位数
+PROMETHEUS_PREFIX = "hotel_"
+
+_enabled = os.getenv("PERF_METRICS", "0") == "1"
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_events = deque(maxlen=EVENT_LOG_SIZE)
+
+class _Histogram:
+    __slots__ = ("buckets", "total", "count", "samples")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+def enabled():
+    return _enabled
+
+def set_enabled(value):
+    """开启/关闭记录（进程级，所有会话共享）"""
+    global _enabled
+    _enabled = bool(value)
+
+def incr(name, value=1):
+    """计数器累加"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def observe(name, seconds):
+    """记录一次耗时（秒）到直方图"""
+    if not _enabled:
+        return
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = _Histogram()
+        hist.buckets[bisect_left(BUCKETS, seconds)] += 1
+        hist.total += seconds
+        hist.count += 1
+        hist.samples.append(seconds)
+        _events.append((time.time(), name, seconds))
+
+@contextmanager
+def span(name):
+    """计时区间：with span("excel_read"): ...，耗时记入同名直方图"""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def reset():
+    """清空全部计数与直方图"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _events.clear()
+
+def _percentile(sorted_samples, p):
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(p / 100 * len(sorted_samples)))]
+
+def snapshot():
+    """当前状态：dict(counters={名称: 值}, spans={名称: dict(count, total, mean, p50, p95, max)})"""
+    with _lock:
+        counters = dict(_counters)
+        hists = {name: (h.count, h.total, sorted(h.samples)) for name, h in _histograms.items()}
+    spans = {
+        name: {
+            'count': count,
+            'total': total,
+            'mean': total / count if count else 0.0,
+            'p50': _percentile(samples, 50),
+            'p95': _percentile(samples, 95),
+            'max': samples[-1] if samples else None,
+        }
+        for name, (count, total, samples) in hists.items()
+    }
+    return {'counters': counters, 'spans': spans}
+
+def to_jsonl():
+    """导出为 JSON Lines：最近的计时事件逐行输出，末尾附计数器快照"""
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+    lines = [json.dumps({'ts': ts, 'type': 'span', 'name': name, 'seconds': round(seconds, 6)})
+             for ts, name, seconds in events]
+    lines.append(json.dumps({'ts': time.time(), 'type': 'counters', 'values': counters}))
+    return "\n".join(lines) + "\n"
+
+def to_prometheus():
+    """导出为 Prometheus 文本格式：计数器为 *_total，计时为 *_seconds 直方图"""
+    with _lock:
+        counters = dict(_counters)
+        hists = {name: (list(h.buckets), h.total, h.count) for name, h in _histograms.items()}
+    lines = []
+    for name, value in sorted(counters.items()):
+        metric = f"{PROMETHEUS_PREFIX}{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, (buckets, total, count) in sorted(hists.items()):
+        metric = f"{PROMETHEUS_PREFIX}{name}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += n
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"{metric}_sum {total:.6f}", f"{metric}_count {count}"]
+    return "\n".join(lines) + "\n"
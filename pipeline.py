@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+评论分析流程（不依赖 Streamlit）
+分块读取工作簿 → 去重 + 增量分析 → 累加维度评分，网页与命令行（cli.py）共用同一套流程。
+分析结果按“文件内容哈希 + 词库版本”保存到本地，网页上传同一文件时可直接载入。
+有评论日期列时同时汇总各维度的每日得分（trends.py），供趋势视图使用。
+"""
+
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from analysis import (
+    DEFAULT_WORKERS, PARALLEL_MIN_ROWS, analyze_comments, make_pool, dimension_totals, rating_totals,
+    merge_totals, means_from_totals
+)
+from analysis_store import analyze_incremental, get_analysis_store
+from ingest import excel_row_count, iter_excel_chunks, find_comment_column
+from lexicon import LEXICON_VERSION
+from trends import daily_totals, find_date_column, merge_daily
+
+RESULTS_DIR = os.getenv("ANALYSIS_RESULTS_DIR", os.path.join(".cache", "results"))
+RESULT_FORMAT = 3   # 结果字段变化时递增，旧格式的结果文件不再命中
+RESULTS_MAX_FILES = int(os.getenv("ANALYSIS_RESULTS_MAX_FILES", "200"))   # 最多保留的结果文件数
+
+def merge_scores(dim_totals, rating_total):
+    """合并文本提取的维度评分与 Excel 自带评分，按分数降序排列"""
+    all_scores = {**means_from_totals(dim_totals), **means_from_totals(rating_total)}
+    return pd.Series(all_scores, dtype=float).sort_values(ascending=False)
+
+def analyze_workbook(file, workers=DEFAULT_WORKERS, store=None, on_chunk=None):
+    """
+    分块读取并分析 Excel 工作簿
+    返回：dict(comment_col, date_col, n_rows, unique_texts, new_texts, preview, scores, table, daily)；
+    未找到评论列时 comment_col 为 None
+    table 为每条评论的列式分析结果（flags/sentiment），供导出明细使用；
+    daily 为各维度的每日汇总（见 trends.daily_totals），没有日期列时为 None；
+    重复评论只分析一次，分析结果库中已有的文本直接复用：
+    unique_texts 为整个文件的不重复文本数（跨块重复只计一次），new_texts 为本次实际分析的文本数
+    on_chunk(result, total_rows)：可选，读取首块后及每块分析完成后回调（用于刷新进度与图表）
+    """
+    total_rows = excel_row_count(file)
+    result = {'comment_col': None, 'date_col': None, 'n_rows': 0, 'unique_texts': 0, 'new_texts': 0,
+              'preview': None, 'scores': pd.Series(dtype=float), 'daily': None}
+    dim_totals = None
+    rating_total = None
+    tables = []
+    seen_keys = set()   # 已出现过的文本哈希，跨块统计不重复文本数
+    store = store or get_analysis_store()
+
+    # 进程池在首次遇到足够多的新评论时才创建：复用已存结果的重复上传无需启动子进程
+    pool = None
+
+    def analyze_new(comments):
+        nonlocal pool
+        if pool is None and workers > 1 and len(comments) >= PARALLEL_MIN_ROWS:
+            pool = make_pool(workers)
+        return analyze_comments(comments, workers=workers, pool=pool)
+
+    # 分块读取：每块分析完立即累加，内存占用与文件大小无关
+    try:
+        for chunk in iter_excel_chunks(file):
+            if result['preview'] is None:
+                result['preview'] = chunk.head()
+                result['comment_col'] = find_comment_column(chunk.columns)
+                result['date_col'] = find_date_column(chunk.columns)
+                if on_chunk:
+                    on_chunk(result, total_rows)
+                if not result['comment_col']:
+                    break
+
+            # 提取评论内容中的标签评分（列式结果表，每条评论只分析一次，已分析过的评论从结果库读取）
+            table, stats = analyze_incremental(chunk[result['comment_col']], store, analyze_new)
+            seen_keys.update(stats['keys'])
+            result['unique_texts'] = len(seen_keys)
+            result['new_texts'] += stats['new']
+            tables.append(table)
+            dim_totals = merge_totals(dim_totals, dimension_totals(table))
+            # 读取Excel中已有的维度评分（示例）
+            rating_total = merge_totals(rating_total, rating_totals(chunk))
+            if result['date_col']:
+                result['daily'] = merge_daily(result['daily'], daily_totals(chunk[result['date_col']], table, chunk))
+            result['n_rows'] += len(chunk)
+            result['scores'] = merge_scores(dim_totals, rating_total)
+            if on_chunk:
+                on_chunk(result, total_rows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if tables:
+        result['table'] = pd.concat(tables)
+    return result
+
+# ==================== 结果文件 ====================
+def result_path(digest, results_dir=None):
+    """分析结果文件路径：文件内容哈希 + 词库版本 + 结果格式，词库或格式变化后旧结果不再命中"""
+    return os.path.join(results_dir or RESULTS_DIR, f"{digest[:32]}_{LEXICON_VERSION}_v{RESULT_FORMAT}.pkl")
+
+def save_result(digest, result, results_dir=None, max_files=RESULTS_MAX_FILES):
+    """保存分析结果（先写临时文件再替换，读取方不会看到写了一半的文件），之后按数量上限清理旧文件"""
+    path = result_path(digest, results_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 临时文件名唯一：同一进程内多个会话同时保存同一文件的结果时互不覆盖
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    prune_results(results_dir, max_files)
+    return path
+
+def load_result(digest, results_dir=None):
+    """
+    读取已保存的分析结果，不存在时返回 None（结果文件由本应用自身生成，仅从本地目录读取）
+    文件损坏或与当前代码不兼容时删除该文件并返回 None，按未命中处理、重新分析
+    """
+    path = result_path(digest, results_dir)
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    os.utime(path)   # 记录最近使用时间，清理时优先保留常用的结果
+    return result
+
+def prune_results(results_dir=None, max_files=RESULTS_MAX_FILES):
+    """结果文件超过 max_files 个时，按最近使用时间删除最旧的文件"""
+    results_dir = results_dir or RESULTS_DIR
+    entries = []
+    for entry in os.scandir(results_dir):
+        if entry.name.endswith('.pkl'):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue   # 其他进程刚刚删除
+    entries.sort()
+    for _, path in entries[:max(0, len(entries) - max_files)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+评分提升规划
+以 NumPy 广播一次性计算“酒店 × 目标评分 × 新增评价结构 × 日均评价数”的整张情景网格：
+达到目标所需的新增评价数与天数。评分按全部评价的简单平均计算（携程/美团简化模型）。
+"""
+
+import numpy as np
+import pandas as pd
+
+from ingest import find_column
+
+# 新增评价结构：(5 星, 4 星, 3 星) 占比
+REVIEW_MIXES = {
+    "全部 5 星": (1.0, 0.0, 0.0),
+    "5 星 90% · 4 星 10%": (0.9, 0.1, 0.0),
+    "5 星 80% · 4 星 15% · 3 星 5%": (0.8, 0.15, 0.05),
+    "5 星 70% · 4 星 20% · 3 星 10%": (0.7, 0.2, 0.1),
+}
+MIX_STARS = np.array([5.0, 4.0, 3.0])
+
+PORTFOLIO_COLUMNS = {
+    'name': ['酒店名称', '酒店', '门店', 'hotel'],
+    'score': ['当前评分', '评分', 'score'],
+    'reviews': ['评价数', '点评数', '评论数', 'reviews'],
+}
+
+def mix_mean(mix):
+    """评价结构对应的新增评价平均星级"""
+    weights = np.asarray(mix, dtype=float)
+    return float(weights @ MIX_STARS / weights.sum())
+
+def required_reviews(current, total, target, new_rating=5.0):
+    """
+    达到目标评分所需的新增评价数（可广播）
+    已达标为 0；新增评价平均星级不高于目标时无法达到，返回 inf
+    """
+    current, total, target, new_rating = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (current, total, target, new_rating))
+    )
+    gap = new_rating - target
+    with np.errstate(divide='ignore', invalid='ignore'):
+        needed = np.ceil((target - current) * total / gap)
+    needed = np.where(gap > 0, needed, np.inf)
+    return np.where(current >= target, 0.0, needed)
+
+def required_five_star(current, total, target):
+    """单个问题：达到目标评分至少还需多少条 5 星好评；目标不低于 5.0 时抛出 ValueError"""
+    if current >= target:
+        return 0
+    if target >= 5.0:
+        raise ValueError("目标评分必须小于5.0")
+    return int(required_reviews(current, total, target))
+
+def sweep(hotels, targets, mixes, velocities):
+    """
+    情景扫描：hotels 为含 酒店名称/当前评分/评价数 列的 DataFrame，
+    mixes 为 {名称: (5星, 4星, 3星)}，velocities 为日均新增评价数列表
+    返回长表，每行一个（酒店, 目标评分, 评价结构, 日均评价数）组合
+    """
+    scores = hotels['当前评分'].to_numpy(dtype=float)[:, None, None, None]
+    totals = hotels['评价数'].to_numpy(dtype=float)[:, None, None, None]
+    target_grid = np.asarray(targets, dtype=float)[None, :, None, None]
+    means = np.array([mix_mean(m) for m in mixes.values()])[None, None, :, None]
+    velocity_grid = np.asarray(velocities, dtype=float)[None, None, None, :]
+
+    needed = required_reviews(scores, totals, target_grid, means)
+    days = np.ceil(needed / velocity_grid)
+    shape = np.broadcast_shapes(needed.shape, velocity_grid.shape)
+
+    h, t, m, v = np.indices(shape).reshape(4, -1)
+    needed = np.broadcast_to(needed, shape).ravel()
+    days = days.ravel()
+    return pd.DataFrame({
+        '酒店名称': hotels['酒店名称'].to_numpy()[h],
+        '当前评分': scores.ravel()[h],
+        '评价数': totals.ravel()[h].astype(int),
+        '目标评分': np.asarray(targets, dtype=float)[t].round(2),
+        '评价结构': np.array(list(mixes), dtype=object)[m],
+        '日均新增评价': np.asarray(velocities, dtype=float)[v],
+        '所需评价数': np.where(np.isfinite(needed), needed, np.nan),
+        '所需天数': np.where(np.isfinite(days), days, np.nan),
+    })
+
+def time_to_target_curves(result, hotel):
+    """某酒店的“目标评分 → 所需天数”曲线：行为目标评分，列为“评价结构 · 日均评价数”"""
+    rows = result[result['酒店名称'] == hotel]
+    labels = rows['评价结构'] + " · " + rows['日均新增评价'].map(lambda v: f"{v:g} 条/天")
+    return rows.assign(情景=labels).pivot_table(
+        index='目标评分', columns='情景', values='所需天数', aggfunc='first', dropna=False, sort=False
+    )
+
+def normalize_portfolio(df):
+    """识别酒店清单的名称/评分/评价数列，统一为 酒店名称/当前评分/评价数；缺列时抛出 ValueError"""
+    found = {key: find_column(df.columns, names) for key, names in PORTFOLIO_COLUMNS.items()}
+    missing = [PORTFOLIO_COLUMNS[key][0] for key, col in found.items() if col is None]
+    if missing:
+        raise ValueError(f"缺少列：{'、'.join(missing)}")
+    hotels = pd.DataFrame({
+        '酒店名称': df[found['name']].astype(str),
+        '当前评分': pd.to_numeric(df[found['score']], errors='coerce'),
+        '评价数': pd.to_numeric(df[found['reviews']], errors='coerce'),
+    })
+    return hotels.dropna().reset_index(drop=True)
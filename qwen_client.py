@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+通义千问（DashScope）HTTP 客户端
+进程内共享一个带连接池的 requests.Session（keep-alive，省去每次请求的 TCP+TLS 握手），
+对 429/5xx 与网络错误按带抖动的指数退避重试，并遵循服务端返回的 Retry-After。
+重试耗尽后抛出 QwenAPIError，而不是返回错误字符串。
+所有请求（含重试）先经过进程级公平限流 LIMITER：各调用方（网页会话、批量任务）轮流取得令牌，
+一个会话的大批量请求不会让其他会话长时间排队。
+支持 SSE 增量输出（stream_generation），逐段返回生成的文本。
+"""
+
+import contextvars
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# 可通过环境变量指向本地模拟服务进行测试
+API_URL = os.getenv("QWEN_API_URL", "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation")
+
+POOL_SIZE = int(os.getenv("QWEN_POOL_SIZE", "10"))       # 连接池大小
+MAX_RETRIES = int(os.getenv("QWEN_MAX_RETRIES", "3"))    # 首次请求之外的最多重试次数
+BACKOFF_BASE = 0.5                                       # 退避基数（秒）
+BACKOFF_MAX = 8.0                                        # 单次等待上限（秒）
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT = float(os.getenv("QWEN_RATE_LIMIT", "5"))    # 进程内所有会话合计每秒最多发起的请求数
+RATE_BURST = float(os.getenv("QWEN_RATE_BURST", "5"))    # 允许的突发请求数
+
+# 当前调用方标识（网页会话 ID 等），用于公平排队；线程池任务需经 submit 提交才能继承
+CLIENT_ID = contextvars.ContextVar("qwen_client_id", default="default")
+
+class QwenAPIError(Exception):
+    """通义千问调用失败；status 为 HTTP 状态码（网络错误时为 None），attempts 为已尝试次数"""
+
+    def __init__(self, message, status=None, retryable=False, attempts=1):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.attempts = attempts
+
+class LatencyTracker:
+    """记录最近若干次成功请求的耗时，用于估计时延分位数（如对冲请求的触发延迟）"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p, default=None, min_samples=20):
+        """第 p 百分位耗时（秒）；样本不足 min_samples 时返回 default"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return default
+        index = min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))
+        return samples[index]
+
+# 进程内共享：所有生成请求（含重试）的端到端耗时
+LATENCY = LatencyTracker()
+
+# ==================== 公平限流 ====================
+class FairRateLimiter:
+    """
+    进程级令牌桶限流（平均每秒 rate 个请求，最多 capacity 个突发），等待中的请求按调用方轮转排队：
+    每个调用方内部先到先得，不同调用方之间依次各取一个令牌（线程安全）
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._queues = {}        # 调用方 -> 等待中的票号（先到先得）
+        self._ring = deque()     # 有请求在等待的调用方，队首轮到下一个令牌
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _leave(self, client, ticket, served):
+        """票号出队：取得令牌的调用方若仍有等待的请求则排到轮转末尾；没有等待的请求时移出轮转"""
+        queue = self._queues[client]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[client]
+            self._ring.remove(client)
+        elif served:
+            self._ring.remove(client)
+            self._ring.append(client)
+        self._cond.notify_all()
+
+    def acquire(self, client=None):
+        """取一个令牌，未轮到或令牌不足时阻塞等待；返回等待秒数"""
+        client = client or CLIENT_ID.get()
+        start = time.monotonic()
+        with self._cond:
+            ticket = next(self._tickets)
+            if client not in self._queues:
+                self._queues[client] = deque()
+                self._ring.append(client)
+            self._queues[client].append(ticket)
+            served = False
+            try:
+                while True:
+                    self._refill()
+                    my_turn = self._ring[0] == client and self._queues[client][0] == ticket
+                    if my_turn and self._tokens >= 1:
+                        self._tokens -= 1
+                        served = True
+                        break
+                    # 令牌不足时定时醒来检查；令牌充足但未轮到时等待前面的请求取走令牌后的通知
+                    self._cond.wait((1 - self._tokens) / self.rate if self._tokens < 1 else None)
+            finally:
+                self._leave(client, ticket, served)
+        waited = time.monotonic() - start
+        metrics.observe("qwen_queue_wait", waited)
+        return waited
+
+    def queue_position(self, client=None):
+        """调用方最早的等待请求前面还有几个调用方；没有等待中的请求时返回 None"""
+        client = client or CLIENT_ID.get()
+        with self._cond:
+            if client not in self._queues:
+                return None
+            return self._ring.index(client)
+
+    def waiting(self):
+        """等待中的请求总数"""
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+# 进程内共享：所有会话的生成请求共用同一个限流器
+LIMITER = FairRateLimiter(RATE_LIMIT, RATE_BURST)
+
+def submit(pool, fn, *args, **kwargs):
+    """向线程池提交任务并带上当前的调用方标识（线程池不会自动传递 contextvars）"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """进程内共享的 HTTP 会话，首次调用时创建"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def _retry_after_seconds(value):
+    """解析 Retry-After（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None):
+    """第 attempt 次重试前的等待时间：优先 Retry-After，否则为全抖动指数退避"""
+    seconds = _retry_after_seconds(retry_after)
+    if seconds is not None:
+        return min(seconds, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def _post_with_retry(payload, api_key, timeout, max_retries, url, stream=False):
+    """
+    发送请求，对可重试的失败退避重试；url 为 None 时使用当前的 API_URL
+    返回 (状态码为 200 的响应, 在限流队列中等待的总秒数)，调用方计时时扣除排队时间
+    """
+    url = url or API_URL
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+    if stream:
+        headers['Accept'] = 'text/event-stream'
+        headers['X-DashScope-SSE'] = 'enable'
+    queued = 0.0
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        queued += LIMITER.acquire()
+        try:
+            response = get_session().post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = QwenAPIError(f"请求失败：{str(e)}", retryable=True, attempts=attempt + 1)
+        else:
+            if response.status_code == 200:
+                return response, queued
+            retryable = response.status_code in RETRY_STATUS
+            error = QwenAPIError(f"API 错误 [{response.status_code}]：{response.text}",
+                                 status=response.status_code, retryable=retryable, attempts=attempt + 1)
+            response.close()
+            if not retryable:
+                metrics.incr("qwen_errors")
+                raise error
+            retry_after = response.headers.get('Retry-After')
+
+        if attempt == max_retries:
+            metrics.incr("qwen_errors")
+            raise error
+        metrics.incr("qwen_retries")
+        time.sleep(backoff_delay(attempt, retry_after))
+
+def post_generation(payload, api_key, timeout=30, max_retries=MAX_RETRIES, url=None):
+    """发送生成请求并返回解析后的 JSON；失败重试耗尽后抛出 QwenAPIError"""
+    start = time.monotonic()
+    response, queued = _post_with_retry(payload, api_key, timeout, max_retries, url)
+    try:
+        result = response.json()
+    except ValueError as e:
+        # 网关错误页等非 JSON 响应：与其他失败一样以 QwenAPIError 交给调用方处理
+        metrics.incr("qwen_errors")
+        raise QwenAPIError(f"API 返回内容不是 JSON：{response.text[:200]}") from e
+    # 只计请求本身（含重试）的耗时：排队时间另记为 qwen_queue_wait，不应推高对冲延迟
+    elapsed = time.monotonic() - start - queued
+    LATENCY.record(elapsed)
+    metrics.observe("qwen_request", elapsed)
+    metrics.incr("qwen_requests")
+    return result
+
+def iter_sse_events(lines):
+    """按 SSE 协议解析文本行，逐个产出 (event, data) 二元组"""
+    event, data = None, []
+    for line in lines:
+        if not line:
+            if data:
+                yield event or 'message', "\n".join(data)
+            event, data = None, []
+        elif line.startswith(':'):
+            continue
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event or 'message', "\n".join(data)
+
+def stream_generation(payload, api_key, timeout=30, max_retries=MAX_RETRIES, url=None):
+    """
+    以 SSE 增量模式发送生成请求，逐段产出新增文本
+    只在收到首个字节前重试；流中途出错时抛出 QwenAPIError
+    """
+    payload = {**payload, "parameters": {**payload.get("parameters", {}), "incremental_output": True}}
+    start = time.monotonic()
+    first = True
+    response, queued = _post_with_retry(payload, api_key, timeout, max_retries, url, stream=True)
+    start += queued   # 首字与整段耗时不含限流排队时间
+    metrics.incr("qwen_requests")
+    try:
+        response.encoding = 'utf-8'
+        lines = response.iter_lines(decode_unicode=True)
+        for event, data in iter_sse_events(lines):
+            try:
+                message = json.loads(data)
+            except json.JSONDecodeError as e:
+                raise QwenAPIError(f"流式响应格式异常：{data[:200]}") from e
+            if event == 'error' or ('code' in message and 'output' not in message):
+                raise QwenAPIError(f"API 错误：{message.get('message', data[:200])}")
+            text = (message.get('output') or {}).get('text')
+            if text:
+                if first:
+                    metrics.observe("qwen_first_token", time.monotonic() - start)
+                    first = False
+                yield text
+    except requests.RequestException as e:
+        raise QwenAPIError(f"流式读取中断：{str(e)}") from e
+    finally:
+        metrics.observe("qwen_stream", time.monotonic() - start)
+        response.close()
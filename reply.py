@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+"""
+智能评论回复引擎
+提示词构建、通义千问 API 调用（含 SSE 流式输出）、字数调节，以及三条回复变体的并发生成；
+限时模式下发送对冲请求，超时则以本地模板回复兜底。
+相同提示词的并发请求（如两位同事粘贴了同一条评论）合并为一次上游调用。
+"""
+
+import hashlib
+import json
+import math
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import metrics
+from analysis import SUGGESTIONS, extract_aspects_and_sentiment
+from cache import SingleFlight
+from qwen_client import LATENCY, QwenAPIError, post_generation, stream_generation, submit
+from reply_cache import get_reply_cache, make_key
+
+# 三条回复的多样性后缀
+VARIANT_SUFFIXES = [
+    "",
+    "\n\n请使用不同的句式和词汇表达相同的意思。",
+    "\n\n请换一种全新的表达方式，避免重复之前的措辞。"
+]
+MAX_PARALLEL_VARIANTS = 3  # 同时进行的生成请求数上限
+
+# 单次请求生成三条回复：要求模型以 JSON 返回全部变体
+MULTI_VARIANT_INSTRUCTION = """
+
+请一次性写出 3 条均满足以上全部要求、但句式和措辞各不相同的回复。
+只输出 JSON，不要包含任何其他文字，格式为：{"replies": ["第一条回复", "第二条回复", "第三条回复"]}"""
+MULTI_VARIANT_MAX_TOKENS = 1200
+
+# ==================== 提示词与 API 调用 ====================
+# 标签系统
+TAG_MAP = {
+    '交通': '【❤️交通便利❤️】',
+    '服务': '【❤️服务周到❤️】',
+    '卫生': '【✅干净整洁✅】',
+    '早餐': '【🍳早餐可口🍳】',
+    '性价比': '【💰性价比高💰】',
+    '环境': '【🌿安静舒适🌿】',
+    '设施': '【🔧设施完善🔧】'
+}
+DEFAULT_TAG = "【🏨舒适入住🏨】"
+
+# 固定不变的规则：作为 system 消息放在请求最前面，所有请求共享同一前缀，便于服务端前缀缓存
+SYSTEM_PROMPT = """你是酒店的官方客服代表，为客人在OTA平台的评论撰写公开回复。酒店信息与本条要求见用户消息。
+回复规则：
+1.开头必须包含指定标签。
+2.称呼：评论含表扬时用“亲爱的”加客人姓名，否则用“尊敬的宾客”。
+3.风格与语气符合指定的风格和情感导向。
+4.结构：正面评论为感谢→具体回应表扬点→结合地理位置说明优势→表达持续努力的决心→邀请再次光临；负面评论为致歉→承认问题→说明改进措施→可提及位置优势弥补短板→邀请再次体验；中性评论为感谢→简要回应内容→提及位置便利性→表达欢迎之意。
+5.结合地理位置灵活回应：位置优越可感谢客人认可；位置偏僻可说明“虽地处安静区域，我们将持续优化交通指引”；近地铁/景区可强调交通便捷或步行可达景点。
+6.字数控制在210–240个汉字之间（不含标签），不得少于200或多于250。
+7.禁止使用过度夸张词汇（如“极其”“完美”）。
+8.结尾必须包含类似“期待您再次光临，祝您生活愉快！”的表达。
+9.不提及API、模型、技术细节或内部流程。
+10.直接输出最终回复内容，不要包含“回复：”等前缀。"""
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]
+
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+_WORD_RE = re.compile(r'[A-Za-z0-9]+')
+_OTHER_RE = re.compile(r'[^\sA-Za-z0-9\u4e00-\u9fff]')
+_SPACE_RE = re.compile(r'\s+')
+
+def reply_tags(info: dict) -> str:
+    """根据评论维度与情感选择回复开头的标签"""
+    tags = "".join(TAG_MAP.get(aspect, "") for aspect in info['aspects'])
+    if not tags or info['sentiment'] == "负面":
+        tags = DEFAULT_TAG
+    return tags
+
+def generate_prompt(review: str, guest_name: str, hotel_name: str, hotel_nickname: str, review_source: str, hotel_location: str, style: str = "标准"):
+    """生成给大模型的提示词（user 消息部分，支持风格）"""
+    info = extract_aspects_and_sentiment(review)
+
+    tags = reply_tags(info)
+
+    # 情感导向
+    sentiment_guidance = ""
+    if info['sentiment'] == "正面":
+        sentiment_guidance = "客人对本次入住体验表示满意，重点表扬了某些方面。请表达感谢，并强调我们始终致力于提供高品质服务。"
+    elif info['sentiment'] == "负面":
+        sentiment_guidance = "客人对本次入住存在不满，可能涉及服务、设施或环境问题。请首先诚恳道歉，说明已记录反馈并正在改进，展现酒店的责任感与改进决心。"
+    else:
+        sentiment_guidance = "客人评论较为中立，未明确表达强烈情感。请表达欢迎与感谢，传递酒店的温暖与专业形象。"
+
+    # 风格化指导
+    style_guidance = {
+        "正式": "语气正式、专业、得体，适合高端酒店或负面评论。",
+        "亲切": "语气温暖、真诚、带人情味，适合家庭型酒店。",
+        "幽默": "适当使用轻松幽默的语言，但不轻浮，适合年轻客群。",
+        "文艺": "使用优美、有画面感的语言，适合景区/度假酒店。",
+        "简洁": "语言简练，重点突出，适合快速回复场景。"
+    }
+
+    additional_notes = []
+    if info['has_complaint']:
+        additional_notes.append("注意：评论中包含负面反馈，请避免过度赞美，优先体现关怀与改进态度。")
+    if info['has_praise']:
+        additional_notes.append("注意：评论中包含明确表扬，请具体回应并表达感谢。")
+    if info['has_facility_issue']:
+        additional_notes.append("提及设施陈旧或损坏，请回应‘已反馈工程部评估升级’或类似表述。")
+    if info['has_noise']:
+        additional_notes.append("提及噪音问题，请承诺‘加强隔音管理’或‘优化客房分配策略’。")
+
+    # 仅包含随评论变化的内容，固定规则见 SYSTEM_PROMPT；酒店信息在前、单条评论信息在后
+    lines = [
+        f"酒店：{hotel_name}；客服昵称：{hotel_nickname}；位置：{hotel_location}",
+        f"平台：{review_source}；客人姓名：{guest_name}；标签：{tags}",
+        f"风格：{style_guidance.get(style, '标准')}",
+        f"情感导向：{sentiment_guidance}",
+        f"附加提示：{' '.join(additional_notes) if additional_notes else '无'}",
+        f"客人评论：{review.strip()}"
+    ]
+    return "\n".join(lines)
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 Token 数：汉字约 0.75 个/字，英文单词与数字约 1.3 个/词，其他符号及每段连续空白各 1 个"""
+    cjk = len(_CJK_RE.findall(text))
+    words = len(_WORD_RE.findall(text))
+    others = len(_OTHER_RE.findall(text))
+    spaces = len(_SPACE_RE.findall(text))
+    return math.ceil(cjk * 0.75 + words * 1.3 + others + spaces)
+
+def prompt_token_estimate(prompt: str) -> dict:
+    """单次请求的输入 Token 估算：system 为固定前缀（可被服务端前缀缓存复用），user 为随评论变化部分"""
+    system = estimate_tokens(SYSTEM_PROMPT)
+    user = estimate_tokens(prompt)
+    return {"system": system, "user": user, "total": system + user}
+
+def build_payload(prompt: str, max_tokens: int = 300) -> dict:
+    """构建通义千问请求体：固定规则作为 system 消息在前，随评论变化的内容作为 user 消息在后"""
+    return {
+        "model": "qwen-max",
+        "input": {
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+        },
+        "parameters": {
+            "result_format": "text",
+            "max_tokens": max_tokens,
+            "temperature": 0.6,
+            "top_p": 0.85
+        }
+    }
+
+# 进程内共享：正在进行的生成请求，键同回复缓存
+_in_flight = SingleFlight()
+
+def _cache_key(prompt: str, payload: dict) -> str:
+    return make_key(prompt, {"model": payload["model"], "system": SYSTEM_PROMPT_VERSION, **payload["parameters"]})
+
+def _request_budget(deadline_at: float = None) -> dict:
+    """单次请求的超时与重试次数：有截止时间时超时取剩余时间（至少 1 秒）且不重试，保证请求不会比截止时间活得更久"""
+    if deadline_at is None:
+        return {}
+    return {"timeout": max(deadline_at - time.monotonic(), 1.0), "max_retries": 0}
+
+def call_qwen_api(prompt: str, api_key: str, use_cache: bool = True, max_tokens: int = 300,
+                  deadline_at: float = None) -> str:
+    """
+    调用通义千问API（共享连接池与限流，429/5xx 自动退避重试）；失败时抛出 QwenAPIError
+    use_cache=False 时跳过缓存读取、强制重新生成，新结果仍会写入缓存
+    use_cache=True 时与正在进行的相同请求合并，共享同一次上游调用的结果
+    deadline_at（time.monotonic() 时刻）：限时模式下的截止时间，见 _request_budget
+    """
+    payload = build_payload(prompt, max_tokens=max_tokens)
+    cache = get_reply_cache()
+    key = _cache_key(prompt, payload)
+
+    def generate():
+        result = post_generation(payload, api_key, **_request_budget(deadline_at))
+        try:
+            text = result['output']['text'].strip()
+        except (KeyError, TypeError, AttributeError) as e:
+            raise QwenAPIError(f"API 返回格式异常：{str(result)[:200]}") from e
+        # 空内容视为失败且不写入缓存，否则之后的每次请求都会命中这条空回复
+        if not text:
+            raise QwenAPIError("模型返回空内容")
+        cache.put(key, text)
+        return text
+
+    # 强制重新生成（含对冲请求）不合并：调用方要的正是一次独立的生成
+    if not use_cache:
+        return generate()
+    cached = cache.get(key)
+    if cached:
+        return cached
+    text, shared = _in_flight.do(key, generate)
+    if shared:
+        metrics.incr("qwen_coalesced")
+    return text
+
+def stream_qwen_api(prompt: str, api_key: str, use_cache: bool = True):
+    """流式调用通义千问API：逐段产出新增文本，结束后将完整文本写入回复缓存"""
+    payload = build_payload(prompt)
+    cache = get_reply_cache()
+    key = _cache_key(prompt, payload)
+    if use_cache:
+        cached = cache.get(key)
+        if cached:
+            yield cached
+            return
+
+    parts = []
+    for delta in stream_generation(payload, api_key):
+        parts.append(delta)
+        yield delta
+    text = "".join(parts).strip()
+    if text:
+        cache.put(key, text)
+
+# ==================== 字数控制 ====================
+MIN_REPLY_CHARS = 200
+MAX_REPLY_CHARS = 250
+REPLY_PUNCT = '，。！？；：""（）【】《》、'   # 计入字数的标点
+SENTENCE_ENDS = '。！？'
+# 字数略少时插入在结尾句之前的通用句子，按顺序选用；缺口超过它们的总长时才调用模型补写
+CLOSING_SENTENCES = [
+    "您的每一条反馈都是我们前进的动力。",
+    "我们会将您的宝贵意见分享给全体员工，持续提升服务品质。",
+    "酒店团队始终以真诚与用心对待每一位客人。",
+    "如有任何需要，欢迎随时与我们联系，我们将竭诚为您服务。"
+]
+PAD_CAPACITY = sum(len(s) for s in CLOSING_SENTENCES)
+
+_length_stats = {"total": 0, "in_range": 0, "trimmed": 0, "padded": 0, "short": 0,
+                 "extend_calls": 0, "extend_failed": 0}
+_length_lock = threading.Lock()
+
+def _record_length(*outcomes):
+    with _length_lock:
+        for outcome in outcomes:
+            _length_stats[outcome] += 1
+
+def length_stats() -> dict:
+    """字数控制统计：各结果的条数，以及调用模型补写的比例 extend_rate"""
+    with _length_lock:
+        stats = dict(_length_stats)
+    stats["extend_rate"] = stats["extend_calls"] / stats["total"] if stats["total"] else 0.0
+    return stats
+
+def count_reply_chars(text: str) -> int:
+    """统计回复字数（中英文字符、数字及常用中文标点），与字数调节、页面显示共用"""
+    return sum(1 for c in text if c.isalnum() or c in REPLY_PUNCT)
+
+def trim_reply(text: str, min_words: int = MIN_REPLY_CHARS, max_words: int = MAX_REPLY_CHARS):
+    """
+    一次线性扫描完成清理与截断：只保留计入字数的字符，同时记录 [min, max] 区间内最后一个句末标点；
+    超过 max 时在该处截断（区间内没有句末标点则直接截到 max）。返回 (文本, 是否截断)
+    """
+    kept = []
+    cut = 0
+    for c in text:
+        if not (c.isalnum() or c in REPLY_PUNCT):
+            continue
+        if len(kept) == max_words:
+            return ''.join(kept[:cut or max_words]), True
+        kept.append(c)
+        if c in SENTENCE_ENDS and len(kept) >= min_words:
+            cut = len(kept)
+    return ''.join(kept), False
+
+def pad_reply(content: str, min_words: int = MIN_REPLY_CHARS, max_words: int = MAX_REPLY_CHARS) -> str:
+    """在结尾句（通常是“期待您再次光临……”）之前插入通用句子，补到 min 字且不超过 max"""
+    last = max(content.rfind(p, 0, len(content) - 1) for p in SENTENCE_ENDS) + 1
+    if not content or content[-1] not in SENTENCE_ENDS:
+        last = len(content)
+    head, tail = content[:last], content[last:]
+    length = len(content)
+    for sentence in CLOSING_SENTENCES:
+        if length >= min_words:
+            break
+        if sentence in content or length + len(sentence) > max_words:
+            continue
+        head += sentence
+        length += len(sentence)
+    return head + tail
+
+def truncate_to_word_count(text: str, min_words=MIN_REPLY_CHARS, max_words=MAX_REPLY_CHARS, prompt="", api_key="",
+                           deadline_at: float = None) -> str:
+    """
+    智能调节文本长度至指定范围（200-250字），常见情况下不再调用模型
+    - 若过长：截断至区间内最近的句末标点
+    - 若略短：在本地插入通用句子补足
+    - 缺口超过本地可补的长度时，才调用大模型补写一次（计入 extend_calls）；已过截止时间 deadline_at 时不再补写
+    """
+    content, trimmed = trim_reply(text, min_words, max_words)
+    if trimmed:
+        _record_length("total", "trimmed")
+        return content
+    if len(content) >= min_words:
+        _record_length("total", "in_range")
+        return content
+
+    expired = deadline_at is not None and deadline_at <= time.monotonic()
+    if min_words - len(content) > PAD_CAPACITY and prompt and api_key and not expired:
+        extend_prompt = "\n".join([
+            f"请将以下客服回复自然地扩展至{min_words}-{max_words}字，保持原有风格和信息，"
+            "可补充对酒店服务、环境或地理位置的描述，但不要改变原意或添加虚构信息：",
+            content,
+            "请直接输出扩展后的完整回复。"
+        ])
+        _record_length("extend_calls")
+        metrics.incr("length_extension_calls")
+        try:
+            with metrics.span("length_extension"):
+                extended = call_qwen_api(extend_prompt, api_key, deadline_at=deadline_at)
+        except QwenAPIError:
+            # 补写失败时保留已生成的内容，走本地补句
+            _record_length("extend_failed")
+        else:
+            ext_content, trimmed = trim_reply(extended, min_words, max_words)
+            if trimmed or len(ext_content) >= min_words:
+                _record_length("total", "trimmed" if trimmed else "in_range")
+                return ext_content
+            content = max(content, ext_content, key=len)
+
+    padded = pad_reply(content, min_words, max_words)
+    _record_length("total", "padded" if len(padded) >= min_words else "short")
+    return padded
+
+def _finish_reply(raw_reply: str, prompt: str, api_key: str, number: int, deadline_at: float = None) -> dict:
+    """对模型原始输出做字数调节，组装成回复结果；原始输出为空时抛出 QwenAPIError，由调用方走失败/兜底流程"""
+    # 空输出不补句、不补写：否则只会得到一段由通用结尾句拼成的“成功”回复
+    if not raw_reply or not raw_reply.strip():
+        raise QwenAPIError("模型返回空内容")
+    # 使用增强版函数确保字数
+    reply = truncate_to_word_count(raw_reply, prompt=prompt, api_key=api_key, deadline_at=deadline_at)
+    return {
+        "reply": reply,
+        "word_count": count_reply_chars(reply),
+        "number": number,
+        "error": None,
+        "fallback": False
+    }
+
+def _failed_reply(number: int, error: Exception) -> dict:
+    return {
+        "reply": f"🚨 生成失败：{str(error)}",
+        "word_count": 0,
+        "number": number,
+        "error": str(error),
+        "fallback": False
+    }
+
+def generate_reply(prompt: str, api_key: str, number: int = 1, use_cache: bool = True,
+                   deadline_at: float = None) -> dict:
+    """
+    生成单条回复：调用模型后调节字数（缺口过大时才再补写一次）；失败时抛出异常
+    deadline_at：限时模式下的截止时间，其间的每个请求都以剩余时间为超时且不重试
+    """
+    raw_reply = call_qwen_api(prompt, api_key=api_key, use_cache=use_cache, deadline_at=deadline_at)
+    return _finish_reply(raw_reply, prompt, api_key, number, deadline_at)
+
+def generate_reply_variants(prompt: str, api_key: str, max_workers: int = MAX_PARALLEL_VARIANTS,
+                            use_cache: bool = True) -> list:
+    """
+    并发生成三条回复变体（各自的补写请求也在同一线程内完成），总耗时约等于最慢的一条
+    单条失败只影响该条：对应结果的 error 字段记录原因，其余回复照常返回
+    use_cache=False 时跳过回复缓存，生成全新的变体
+    """
+    prompts = [prompt + suffix for suffix in VARIANT_SUFFIXES]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [submit(pool, generate_reply, p, api_key, i + 1, use_cache) for i, p in enumerate(prompts)]
+
+    replies = []
+    for i, future in enumerate(futures):
+        try:
+            replies.append(future.result())
+        except Exception as e:
+            replies.append(_failed_reply(i + 1, e))
+    return replies
+
+def stream_reply_variants(prompt: str, api_key: str, max_workers: int = MAX_PARALLEL_VARIANTS,
+                          use_cache: bool = True, idle_timeout: float = None):
+    """
+    并发流式生成三条回复，按到达顺序产出事件：
+      ("delta", 序号, 新增文本)：模型输出的增量片段
+      ("done", 序号, 结果字典)：该条已结束并完成字数调节，格式同 generate_reply（失败时 error 非空）
+      ("idle", 0, None)：仅在设置 idle_timeout 时产出，表示这段时间内没有新事件（供调用方刷新排队状态）
+    """
+    prompts = [prompt + suffix for suffix in VARIANT_SUFFIXES]
+    events = queue.Queue()
+
+    def worker(variant_prompt, number):
+        try:
+            parts = []
+            for delta in stream_qwen_api(variant_prompt, api_key, use_cache=use_cache):
+                parts.append(delta)
+                events.put(("delta", number, delta))
+            result = _finish_reply("".join(parts).strip(), variant_prompt, api_key, number)
+        except Exception as e:
+            result = _failed_reply(number, e)
+        events.put(("done", number, result))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for i, p in enumerate(prompts):
+            submit(pool, worker, p, i + 1)
+        remaining = len(prompts)
+        while remaining:
+            try:
+                event = events.get(timeout=idle_timeout)
+            except queue.Empty:
+                yield ("idle", 0, None)
+                continue
+            if event[0] == "done":
+                remaining -= 1
+            yield event
+
+def parse_variant_json(text: str) -> list:
+    """从模型输出中解析回复列表；容忍 ```json 代码块及前后多余文字，格式不符时抛出 ValueError"""
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        raise ValueError("输出中未找到 JSON 对象")
+    replies = json.loads(text[start:end + 1]).get('replies')
+    if not isinstance(replies, list):
+        raise ValueError("JSON 中缺少 replies 列表")
+    replies = [r.strip() for r in replies if isinstance(r, str) and r.strip()]
+    if not replies:
+        raise ValueError("replies 列表为空")
+    return replies[:len(VARIANT_SUFFIXES)]
+
+def generate_reply_variants_single_call(prompt: str, api_key: str, use_cache: bool = True) -> list:
+    """
+    一次请求生成三条回复：提示词只发送、计费一次，各条字数在本地校验调节
+    模型输出无法解析时退回 generate_reply_variants；返回条数不足时仅为缺少的序号单独补生成
+    """
+    multi_prompt = prompt + MULTI_VARIANT_INSTRUCTION
+    try:
+        raw = call_qwen_api(multi_prompt, api_key, use_cache=use_cache, max_tokens=MULTI_VARIANT_MAX_TOKENS)
+    except Exception as e:
+        return [_failed_reply(i + 1, e) for i in range(len(VARIANT_SUFFIXES))]
+
+    try:
+        texts = parse_variant_json(raw)
+    except ValueError:
+        # 不合格的输出不保留在缓存中，避免下次命中后再次解析失败
+        get_reply_cache().delete(_cache_key(multi_prompt, build_payload(multi_prompt, MULTI_VARIANT_MAX_TOKENS)))
+        return generate_reply_variants(prompt, api_key, use_cache=use_cache)
+
+    replies = []
+    for i, suffix in enumerate(VARIANT_SUFFIXES):
+        try:
+            if i < len(texts):
+                replies.append(_finish_reply(texts[i], prompt + suffix, api_key, i + 1))
+            else:
+                replies.append(generate_reply(prompt + suffix, api_key, i + 1, use_cache))
+        except Exception as e:
+            replies.append(_failed_reply(i + 1, e))
+    return replies
+
+# ==================== 限时生成：对冲请求 + 本地模板兜底 ====================
+DEFAULT_HEDGE_DELAY = 8.0     # 耗时样本不足时的对冲延迟（秒）
+_hedge_pool = ThreadPoolExecutor(max_workers=12, thread_name_prefix="qwen-hedge")
+
+def render_fallback_reply(review: str, guest_name: str, hotel_name: str, hotel_nickname: str,
+                          hotel_location: str) -> str:
+    """不调用模型，根据评论维度/情感与优化建议库在本地拼出一条模板回复"""
+    info = extract_aspects_and_sentiment(review)
+    aspects = "、".join(info['aspects'])
+    greeting = f"亲爱的{guest_name}" if info['has_praise'] else "尊敬的宾客"
+    parts = [reply_tags(info), f"{greeting}，您好！感谢您选择{hotel_name}并留下宝贵的评价。"]
+
+    if info['sentiment'] == "负面":
+        parts.append("对于本次入住未能让您完全满意，我们深表歉意。")
+        if aspects:
+            parts.append(f"您反馈的{aspects}方面的问题，我们已详细记录并转交相关部门跟进。")
+        for aspect in info['aspects'][:2]:
+            if aspect in SUGGESTIONS:
+                parts.append(f"接下来我们将{SUGGESTIONS[aspect]}")
+    elif info['sentiment'] == "正面":
+        if aspects:
+            parts.append(f"很高兴您认可我们的{aspects}，这是对我们团队最大的鼓励。")
+        parts.append("我们始终致力于为每一位客人提供高品质的服务与舒适的入住体验。")
+    else:
+        parts.append("您的每一条意见都是我们持续进步的动力，我们会认真对待。")
+
+    if info['has_facility_issue']:
+        parts.append("关于设施问题，我们已反馈工程部评估升级。")
+    if info['has_noise']:
+        parts.append("关于噪音问题，我们将加强隔音管理并优化客房分配策略。")
+    parts.append(f"酒店位于{hotel_location}，出行便利，我们也将持续优化交通指引与周边信息。")
+    parts.append(f"期待您再次光临，祝您生活愉快！——{hotel_nickname}")
+    return "".join(parts)
+
+def _fallback_result(text: str, number: int, reason: str) -> dict:
+    return {
+        "reply": text,
+        "word_count": count_reply_chars(text),
+        "number": number,
+        "error": reason,
+        "fallback": True
+    }
+
+def _hedged_generate(prompt: str, api_key: str, number: int, deadline_at: float, hedge_delay: float,
+                     use_cache: bool):
+    """
+    先发一个请求；超过 hedge_delay 仍未返回且截止前还有时间时，再发一个相同的对冲请求，
+    取截止时间前最先成功的结果；均未成功时返回 (None, 原因)
+    hedge_delay 不短于剩余时限时不对冲；请求失败（已在客户端内重试过）后也不再补发相同请求
+    """
+    # 主请求与对冲请求都带上截止时间：放弃等待后它们也会很快结束，不会长期占用共享线程池
+    pending = {submit(_hedge_pool, generate_reply, prompt, api_key, number, use_cache, deadline_at)}
+    hedged = hedge_delay >= deadline_at - time.monotonic()
+    reason = "超时"
+    while pending:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            break
+        hedge_due = not hedged and hedge_delay < remaining
+        done, pending = wait(pending, timeout=hedge_delay if hedge_due else remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result(), None
+            reason = str(future.exception())
+        if hedge_due and not done and deadline_at - time.monotonic() > 0:
+            # 对冲请求跳过缓存：主请求若命中缓存早已返回
+            pending.add(submit(_hedge_pool, generate_reply, prompt, api_key, number, False, deadline_at))
+            hedged = True
+    return None, reason
+
+def generate_reply_variants_with_deadline(prompt: str, api_key: str, deadline: float, fallback_text: str,
+                                          hedge_percentile: float = 90, use_cache: bool = True) -> list:
+    """
+    限时生成三条回复：每条在历史耗时的 hedge_percentile 分位处发出对冲请求，
+    到 deadline 秒仍无结果（或全部失败）的回复以 fallback_text 兜底，并标记 fallback=True
+    """
+    deadline_at = time.monotonic() + deadline
+    hedge_delay = LATENCY.percentile(hedge_percentile, default=DEFAULT_HEDGE_DELAY)
+    prompts = [prompt + suffix for suffix in VARIANT_SUFFIXES]
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        futures = [
+            submit(pool, _hedged_generate, p, api_key, i + 1, deadline_at, hedge_delay, use_cache)
+            for i, p in enumerate(prompts)
+        ]
+    replies = []
+    for i, future in enumerate(futures):
+        result, reason = future.result()
+        replies.append(result if result is not None else _fallback_result(fallback_text, i + 1, reason))
+    return replies
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+回复缓存
+以“规范化提示词 + 模型参数”的哈希为键，内存 LRU 在前、SQLite 持久化在后，
+支持过期时间（TTL）与按条目数淘汰。重复生成同一条评论的回复时直接命中缓存。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+from cache import LRUCache
+
+CACHE_PATH = os.getenv("REPLY_CACHE_PATH", os.path.join(".cache", "reply_cache.sqlite3"))
+CACHE_TTL = int(os.getenv("REPLY_CACHE_TTL", str(7 * 24 * 3600)))   # 过期时间（秒）
+CACHE_MAX_ROWS = int(os.getenv("REPLY_CACHE_MAX_ROWS", "5000"))     # 磁盘最多保留条数
+MEMORY_ENTRIES = 256                                                 # 内存 LRU 条数
+
+def normalize_prompt(prompt):
+    """规范化提示词：合并空白、去掉首尾空白，排版差异不影响命中"""
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+def make_key(prompt, params):
+    """缓存键：规范化提示词与模型参数的 SHA-256"""
+    raw = normalize_prompt(prompt) + "\x00" + json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class ReplyCache:
+    """内存 LRU + SQLite 两级回复缓存（线程安全）"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_rows=CACHE_MAX_ROWS, memory_entries=MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._memory = LRUCache(max_entries=memory_entries)
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS replies ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_replies_accessed ON replies (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """命中且未过期时返回缓存文本，否则返回 None"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None and now - entry[1] < self.ttl:
+            with self._lock:
+                self.hits += 1
+            metrics.incr("reply_cache_hits")
+            return entry[0]
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM replies WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM replies WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                metrics.incr("reply_cache_misses")
+                return None
+            self._conn.execute("UPDATE replies SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        metrics.incr("reply_cache_hits")
+        self._memory.put(key, row)
+        return row[0]
+
+    def put(self, key, value):
+        """写入缓存；超出条数上限时淘汰最久未访问的记录"""
+        now = time.time()
+        self._memory.put(key, (value, now))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO replies (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM replies").fetchone()[0] - self.max_rows
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM replies WHERE key IN "
+                    "(SELECT key FROM replies ORDER BY accessed_at LIMIT ?)", (overflow,)
+                )
+            self._conn.execute("DELETE FROM replies WHERE created_at < ?", (now - self.ttl,))
+            self._conn.commit()
+
+    def delete(self, key):
+        """删除一条缓存"""
+        self._memory.delete(key)
+        with self._lock:
+            self._conn.execute("DELETE FROM replies WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def size(self):
+        """磁盘中的缓存条数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM replies").fetchone()[0]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_reply_cache():
+    """进程内共享的回复缓存，首次调用时创建"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReplyCache()
+    return _cache
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+维度趋势
+分析时按评论日期把各维度得分汇总为“每日累计和 + 命中数”（天数 × 维度，与评论条数无关），
+之后切换粒度（日/周/月）、滚动窗口或日期范围都只在这张日汇总表上重采样，不再扫描原始评论。
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis import RATING_COLUMNS, aspect_matrix
+from ingest import find_column
+from lexicon import ASPECTS
+
+DATE_COLUMNS = ['点评日期', '评论日期', '评价日期', '入住日期', '发布时间', '日期', '时间', 'date']
+
+# 粒度：(重采样规则, 滚动窗口单位)
+FREQUENCIES = {
+    "按日": ("D", "天"),
+    "按周": ("W-MON", "周"),
+    "按月": ("MS", "个月"),
+}
+
+def find_date_column(columns):
+    """识别评论日期列，未找到时返回 None"""
+    return find_column(columns, DATE_COLUMNS)
+
+def daily_totals(dates, table, chunk, columns=RATING_COLUMNS):
+    """
+    一块评论的每日汇总：index 为日期，列为 (sum/count, 维度) 两级
+    文本维度取情感得分，Excel 自带的评分列取原值；日期无法识别的行不计入
+    """
+    days = pd.to_datetime(dates, errors='coerce', format='mixed').dt.normalize()
+    valid = days.notna().to_numpy()
+    hits = aspect_matrix(table)[valid]
+    sentiment = np.nan_to_num(table['sentiment'].to_numpy(dtype=np.float64))[valid]
+    present = [col for col in columns if col in chunk.columns]
+    ratings = chunk[present].apply(pd.to_numeric, errors='coerce')[valid]
+
+    index = pd.DatetimeIndex(days[valid], name='日期')
+    sums = pd.DataFrame(sentiment[:, None] * hits, index=index, columns=ASPECTS)
+    counts = pd.DataFrame(hits.astype(np.int64), index=index, columns=ASPECTS)
+    sums[present] = ratings.fillna(0).to_numpy()
+    counts[present] = ratings.notna().to_numpy(dtype=np.int64)
+    return pd.concat({'sum': sums, 'count': counts}, axis=1).groupby(level=0).sum()
+
+def merge_daily(total, chunk_total):
+    """累加两份日汇总（日期可能跨块重叠）；total 为 None 时直接返回 chunk_total"""
+    if total is None:
+        return chunk_total
+    return pd.concat([total, chunk_total]).groupby(level=0).sum()
+
+def date_range(daily):
+    """日汇总覆盖的首尾日期"""
+    return daily.index.min().date(), daily.index.max().date()
+
+def trend_frame(daily, freq="W-MON", window=1, start=None, end=None, min_count=1):
+    """
+    按粒度重采样并做滚动窗口汇总，返回 (均值表, 样本数表)：行为各期起始日期，列为维度
+    滚动均值按窗口内的累计和 / 累计命中数计算（以样本数加权）；样本数不足 min_count 的格子为空
+    """
+    daily = daily.loc[pd.Timestamp(start) if start else None:pd.Timestamp(end) if end else None]
+    if freq == "D":
+        periods = daily.asfreq("D", fill_value=0)
+    else:
+        periods = daily.resample(freq, label='left', closed='left').sum()
+    if window > 1:
+        periods = periods.rolling(window, min_periods=1).sum()
+    sums, counts = periods['sum'], periods['count']
+    means = (sums / counts.where(counts >= max(min_count, 1))).round(2)
+    present = counts.columns[counts.sum() > 0]
+    return means[present], counts[present].astype(int)